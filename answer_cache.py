@@ -0,0 +1,196 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """Lowercases a question and reduces it to space-separated words."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", question.lower()).split())
+
+
+def _trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Words that flip the answer while changing only a few trigrams, such as
+# "old regime" against "new regime" or "senior" against "super senior".
+DISCRIMINATING_WORDS = frozenset((
+    "old", "new", "regime", "senior", "super", "citizen", "citizens", "resident", "nri",
+    "not", "no", "without", "above", "below", "before", "after", "more", "less", "maximum", "minimum",
+))
+
+
+def _key_terms(text):
+    # Section numbers, amounts and years ("80c", "150000", "2024") change the
+    # answer too, so near-duplicates must agree on all of these exactly.
+    return frozenset(token for token in text.split()
+                     if token in DISCRIMINATING_WORDS or any(ch.isdigit() for ch in token))
+
+
+class AnswerCache:
+    """Persistent cache of Tax Advisor answers keyed by normalised question.
+
+    Exact matches on the normalised text are served first; otherwise the most
+    similar cached question by character-trigram Jaccard similarity is used
+    if it clears `similarity_threshold` and uses the same section numbers,
+    amounts, years and DISCRIMINATING_WORDS.
+    """
+
+    def __init__(self, path, namespace="", ttl_seconds=7 * 24 * 3600, max_entries=2000,
+                 similarity_threshold=0.85):
+        self.path = path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._index = defaultdict(set)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    namespace TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, question)
+                )
+                """
+            )
+            conn.execute(
+                "DELETE FROM answers WHERE namespace = ? AND created_at < ?", (namespace, time.time() - ttl_seconds)
+            )
+            rows = conn.execute(
+                "SELECT question, answer, created_at FROM answers WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        for question, answer, created_at in rows:
+            self._add(question, answer, created_at)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _add(self, question, answer, created_at):
+        self._entries[question] = (answer, created_at)
+        for gram in _trigrams(question):
+            self._index[gram].add(question)
+
+    def _remove(self, question):
+        self._entries.pop(question, None)
+        for gram in _trigrams(question):
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(question)
+                if not keys:
+                    del self._index[gram]
+
+    def _most_similar(self, question):
+        grams = _trigrams(question)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for candidate in self._index.get(gram, ()):
+                overlap[candidate] += 1
+
+        terms = _key_terms(question)
+        best, best_score = None, 0.0
+        for candidate, shared in overlap.items():
+            score = shared / (len(grams) + len(_trigrams(candidate)) - shared)
+            if score > best_score and _key_terms(candidate) == terms:
+                best, best_score = candidate, score
+        return best, best_score
+
+    def get(self, question):
+        """Returns the cached answer for a question (or a near-duplicate of it), or None."""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            match, score = key, 1.0
+            if key not in self._entries:
+                match, score = self._most_similar(key)
+                if score < self.similarity_threshold:
+                    match = None
+
+            if match is not None and now - self._entries[match][1] > self.ttl_seconds:
+                self._remove(match)
+                match = None
+
+            if match is None:
+                self.misses += 1
+                logger.info("Answer cache miss for %r (hit rate %.0f%%)", key, 100 * self.hit_rate())
+                return None
+
+            self.hits += 1
+            if match != key:
+                self.similar_hits += 1
+            logger.info("Answer cache hit for %r via %r (similarity %.2f, hit rate %.0f%%)",
+                        key, match, score, 100 * self.hit_rate())
+            answer = self._entries[match][0]
+
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE answers SET accessed_at = ? WHERE namespace = ? AND question = ?",
+                (now, self.namespace, match),
+            )
+        return answer
+
+    def put(self, question, answer):
+        """Caches an answer and evicts expired or least recently used entries."""
+        key = normalize_question(question)
+        if not key:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, answer, now, now),
+            )
+            self._remove(key)
+            self._add(key, answer, now)
+
+            expired = [q for q, (_, created_at) in self._entries.items() if now - created_at > self.ttl_seconds]
+            excess = len(self._entries) - len(expired) - self.max_entries
+            if excess > 0:
+                expired += [q for (q,) in conn.execute(
+                    "SELECT question FROM answers WHERE namespace = ? AND created_at >= ? "
+                    "ORDER BY accessed_at ASC LIMIT ?",
+                    (self.namespace, now - self.ttl_seconds, excess),
+                )]
+            for q in expired:
+                conn.execute("DELETE FROM answers WHERE namespace = ? AND question = ?", (self.namespace, q))
+                self._remove(q)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Returns hit/miss counters and the number of cached answers."""
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "entries": len(self._entries),
+        }
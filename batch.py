@@ -0,0 +1,230 @@
+"""Headless bulk processing of Form 16 PDFs.
+
+    python batch.py form16s/ output/ --llm-workers 8 --requests-per-minute 120
+    python batch.py form16s.zip output/
+"""
+import argparse
+import csv
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from extraction_cache import ExtractionCache
+from form16 import MODEL_NAME, build_itr1_json, dump_json_bytes
+from rate_limit import RateLimiter, call_with_retry
+from tax_pipeline import MODEL_BACKENDS, create_model, extract_with_model, prepare_form16
+
+SUMMARY_FIELDS = [
+    "file",
+    "status",
+    "source",
+    "gross_salary",
+    "gross_total_income",
+    "deductions_under_chapter_VI_A",
+    "total_income",
+    "net_tax_payable",
+    "output",
+    "seconds",
+    "error",
+]
+
+
+def iter_pdfs(source):
+    """Yields (name, pdf_bytes) for every PDF in a directory or zip archive."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for name in sorted(archive.namelist()):
+                if name.lower().endswith(".pdf"):
+                    yield name, archive.read(name)
+        return
+
+    for root, _, files in os.walk(source):
+        for filename in sorted(files):
+            if filename.lower().endswith(".pdf"):
+                path = os.path.join(root, filename)
+                with open(path, "rb") as f:
+                    yield os.path.relpath(path, source), f.read()
+
+
+class _BatchModel:
+    """Wraps a model so that every call, chunk calls included, is rate limited, bounded and retried."""
+
+    def __init__(self, model, limiter, max_concurrent, max_retries):
+        self.model = model
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def generate_content(self, prompt, **kwargs):
+        def generate():
+            self.limiter.wait()
+            with self._slots:
+                return self.model.generate_content(prompt, **kwargs)
+
+        return call_with_retry(generate, self.max_retries)
+
+
+def _output_path(output_dir, name):
+    stem = os.path.splitext(name)[0].replace("/", "__").replace("\\", "__")
+    return os.path.join(output_dir, stem + ".itr1.json")
+
+
+_worker_cache = None
+
+
+def _init_worker(cache_path):
+    # Each worker process opens the extraction cache for itself; SQLite
+    # connections cannot be shared across processes.
+    global _worker_cache
+    _worker_cache = ExtractionCache(cache_path) if cache_path else None
+
+
+def _write_itr1(row, record, output_dir):
+    output = _output_path(output_dir, row["file"])
+    with open(output, "wb") as f:
+        f.write(dump_json_bytes(build_itr1_json(record)))
+    row.update({key: record.get(key, 0) for key in SUMMARY_FIELDS[3:8]})
+    row.update(status="ok", output=output)
+
+
+def _failed(row, error):
+    row.update(status="failed", error=str(error) or type(error).__name__)
+
+
+def prepare_pdf(name, pdf_bytes, output_dir, model_name=MODEL_NAME):
+    """Runs the model-free stages for one file in a worker process.
+
+    Returns (row, pending). A file answered by the cache or the rules, or one
+    that failed, has its row complete and pending None; otherwise pending is
+    what process_pending needs to finish it with the model.
+    """
+    started = time.monotonic()
+    row = {"file": name}
+    pending = None
+    try:
+        record, result = prepare_form16(pdf_bytes, _worker_cache, model_name=model_name)
+        if record is None:
+            pending = result
+        else:
+            row["source"] = result["source"]
+            _write_itr1(row, record, output_dir)
+    except Exception as e:
+        _failed(row, e)
+    row["seconds"] = time.monotonic() - started
+    return row, pending
+
+
+def process_pending(row, pending, output_dir, model, cache=None):
+    """Finishes a prepared file with the model and writes its ITR-1 JSON. Failures are recorded, not raised."""
+    started = time.monotonic()
+    try:
+        record, info = extract_with_model(pending, model, cache)
+        row["source"] = info["source"]
+        _write_itr1(row, record, output_dir)
+    except Exception as e:
+        _failed(row, e)
+    row["seconds"] += time.monotonic() - started
+    return row
+
+
+def run_batch(source, output_dir, model, pdf_workers=None, llm_workers=4,
+              requests_per_minute=60, max_retries=3, cache=None, model_name=MODEL_NAME):
+    """Processes every Form 16 in `source`, writing results to `output_dir` as each one finishes.
+
+    The CPU-bound stages of tax_pipeline (cache lookup, page text, OCR and
+    the TRACES rules) run in `pdf_workers` processes. Files that still need
+    the model are finished on `llm_workers` threads, and every model call,
+    chunk calls included, is rate limited and retried. A file that fails is
+    recorded in the summary and the batch goes on. Returns the list of
+    summary rows.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pdf_workers = pdf_workers or os.cpu_count() or 1
+    model = _BatchModel(model, RateLimiter(requests_per_minute), llm_workers, max_retries) if model else None
+    max_pending = 2 * pdf_workers
+    rows = []
+
+    with ProcessPoolExecutor(pdf_workers, initializer=_init_worker, initargs=(cache.path if cache else None,)) \
+            as pdf_pool, ThreadPoolExecutor(llm_workers) as llm_pool, \
+            open(os.path.join(output_dir, "summary.csv"), "w", newline="") as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        summary_file.flush()
+
+        pdfs = iter_pdfs(source)
+        preparing = {}
+        finishing = set()
+
+        def submit_next():
+            for name, pdf_bytes in pdfs:
+                preparing[pdf_pool.submit(prepare_pdf, name, pdf_bytes, output_dir, model_name)] = name
+                return True
+            return False
+
+        def finish(row):
+            row["seconds"] = round(row["seconds"], 3)
+            writer.writerow(row)
+            summary_file.flush()
+            rows.append(row)
+
+        while len(preparing) < max_pending and submit_next():
+            pass
+
+        while preparing or finishing:
+            done, _ = wait(finishing.union(preparing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in finishing:
+                    finishing.discard(future)
+                    finish(future.result())
+                    continue
+                name = preparing.pop(future)
+                try:
+                    row, pending = future.result()
+                except Exception as e:
+                    # The worker process died (BrokenProcessPool) before returning a row.
+                    row, pending = {"file": name, "seconds": 0.0}, None
+                    _failed(row, e)
+                if pending is None:
+                    finish(row)
+                else:
+                    finishing.add(llm_pool.submit(process_pending, row, pending, output_dir, model, cache))
+
+            while len(preparing) < max_pending and submit_next():
+                pass
+
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract ITR-1 JSON from a directory or zip of Form 16 PDFs.")
+    parser.add_argument("source", help="Directory or .zip archive containing Form 16 PDFs")
+    parser.add_argument("output_dir", help="Directory for ITR-1 JSON files and summary.csv")
+    parser.add_argument("--pdf-workers", type=int, default=None,
+                        help="Processes for page text, OCR and rules (default: CPU count)")
+    parser.add_argument("--llm-workers", type=int, default=4, help="Concurrent model calls")
+    parser.add_argument("--requests-per-minute", type=float, default=60, help="Model call rate limit (0 disables)")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--cache", default=os.path.join(".tax_assistant", "extraction_cache.sqlite3"),
+                        help="Extraction cache path ('' disables the cache)")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY", ""))
+    parser.add_argument("--backend", choices=sorted(MODEL_BACKENDS),
+                        default=os.environ.get("TAX_ASSISTANT_MODEL_BACKEND", "gemini"),
+                        help="Model backend; 'replay' answers from recorded responses offline")
+    args = parser.parse_args(argv)
+
+    # Without a key the rules still handle TRACES layouts; other files are
+    # recorded as failed rather than stopping the batch.
+    model = None if args.backend == "gemini" and not args.api_key else create_model(args.api_key, backend=args.backend)
+    cache = ExtractionCache(args.cache) if args.cache else None
+
+    rows = run_batch(args.source, args.output_dir, model, args.pdf_workers, args.llm_workers,
+                     args.requests_per_minute, args.max_retries, cache)
+    failed = sum(1 for row in rows if row["status"] != "ok")
+    print(f"Processed {len(rows)} file(s): {len(rows) - failed} ok, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+"""Columnar tax computation for employee spreadsheets.
+
+    python batch_tax.py employees.csv results.csv
+    python batch_tax.py employees.parquet results.parquet --keep employee_id,name
+    tax-assistant table employees.csv results.csv --age-group 60-80
+
+Reads CSV or Parquet in record batches, loading only the income, deduction,
+age group and --keep columns, computes both regimes column-wise with
+compute_tax_columns, and appends each batch to the output as it goes, so
+memory stays flat however large the file is. The output format follows the
+output file's extension. Uses pyarrow, which Streamlit already depends on.
+"""
+import argparse
+import os
+import sys
+import time
+
+from tax_engine import AGE_GROUPS, DEFAULT_FINANCIAL_YEAR, FINANCIAL_YEARS
+from tax_pipeline import DEDUCTION_FIELDS, INCOME_FIELDS, compute_tax_columns
+
+INPUT_FIELDS = INCOME_FIELDS + DEDUCTION_FIELDS
+RESULT_FIELDS = (
+    "total_income",
+    "total_deductions",
+    "taxable_income_old",
+    "taxable_income_new",
+    "tax_old",
+    "tax_new",
+    "recommended_regime",
+    "tax_saving",
+)
+
+
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _csv_header(path):
+    import pyarrow.csv as pacsv
+
+    with pacsv.open_csv(path, read_options=pacsv.ReadOptions(block_size=1 << 16)) as reader:
+        return reader.schema.names
+
+
+def _empty_batch(schema):
+    import pyarrow as pa
+
+    return pa.RecordBatch.from_arrays([pa.array([], type=field.type) for field in schema], schema=schema)
+
+
+def iter_batches(path, columns, batch_rows=262144):
+    """Yields pyarrow RecordBatches holding only `columns` that exist in the file.
+
+    A file without rows yields one empty batch, so the output still gets its header.
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        present = [name for name in columns if name in parquet.schema_arrow.names]
+        if parquet.metadata.num_rows == 0:
+            import pyarrow as pa
+            yield _empty_batch(pa.schema([parquet.schema_arrow.field(name) for name in present]))
+            return
+        yield from parquet.iter_batches(batch_size=batch_rows, columns=present)
+        return
+
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    present = [name for name in columns if name in _csv_header(path)]
+    # Amounts are read as float64 so "1500.50" and blanks parse the same way in
+    # every block; age groups are always read as text.
+    column_types = {name: pa.float64() for name in present if name in INPUT_FIELDS}
+    if "age_group" in present:
+        column_types["age_group"] = pa.string()
+    convert = pacsv.ConvertOptions(include_columns=present, column_types=column_types)
+    with pacsv.open_csv(path, read_options=pacsv.ReadOptions(block_size=batch_rows * 64),
+                        convert_options=convert) as reader:
+        empty = True
+        for batch in reader:
+            empty = False
+            yield batch
+        if empty:
+            yield _empty_batch(reader.schema)
+
+
+def compute_batch(batch, age_group="Below 60", keep=(), financial_year=DEFAULT_FINANCIAL_YEAR):
+    """Returns a RecordBatch of the `keep` columns followed by the tax results for one input batch."""
+    import numpy as np
+    import pyarrow as pa
+
+    names = batch.schema.names
+    columns = {
+        name: batch.column(name).to_numpy(zero_copy_only=False)
+        for name in INPUT_FIELDS if name in names
+    }
+    if not columns:
+        columns = {INPUT_FIELDS[0]: np.zeros(batch.num_rows)}
+    age_groups = age_group
+    if "age_group" in names:
+        # Blank cells take the default; any other label must be one of AGE_GROUPS.
+        age_groups = np.asarray(batch.column("age_group").fill_null(age_group).to_numpy(zero_copy_only=False))
+        if age_groups.dtype.kind in "OU":
+            age_groups = np.where(age_groups == "", age_group, age_groups)
+
+    results = compute_tax_columns(columns, age_groups, financial_year)
+    arrays = [batch.column(name) for name in keep if name in names]
+    fields = [name for name in keep if name in names]
+    arrays += [pa.array(results[name]) for name in RESULT_FIELDS]
+    return pa.RecordBatch.from_arrays(arrays, names=fields + list(RESULT_FIELDS))
+
+
+class _Writer:
+    """Appends RecordBatches to a CSV or Parquet file, opened on the first batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def write(self, batch):
+        if self._writer is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if _is_parquet(self.path):
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, batch.schema)
+            else:
+                import pyarrow.csv as pacsv
+                self._writer = pacsv.CSVWriter(self.path, batch.schema)
+        self._writer.write_batch(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run_table(source, output, age_group="Below 60", keep=(), batch_rows=262144,
+              financial_year=DEFAULT_FINANCIAL_YEAR):
+    """Computes tax for every row of `source` into `output`. Returns (rows, seconds)."""
+    started = time.perf_counter()
+    rows = 0
+    columns = list(INPUT_FIELDS) + ["age_group"] + [name for name in keep if name not in INPUT_FIELDS]
+    writer = _Writer(output)
+    try:
+        for batch in iter_batches(source, columns, batch_rows):
+            writer.write(compute_batch(batch, age_group, keep, financial_year))
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute old and new regime tax for every row of a CSV or Parquet file.")
+    parser.add_argument("source", help="CSV or Parquet file with income and deduction columns")
+    parser.add_argument("output", help="Output file (.csv or .parquet)")
+    parser.add_argument("--age-group", choices=AGE_GROUPS, default=AGE_GROUPS[0],
+                        help="Age group for rows without an age_group column")
+    parser.add_argument("--financial-year", choices=FINANCIAL_YEARS, default=DEFAULT_FINANCIAL_YEAR)
+    parser.add_argument("--keep", default="", help="Comma-separated input columns to copy to the output, e.g. employee_id")
+    parser.add_argument("--batch-rows", type=int, default=262144)
+    args = parser.parse_args(argv)
+
+    keep = tuple(name for name in args.keep.split(",") if name)
+    try:
+        rows, seconds = run_table(args.source, args.output, args.age_group, keep, args.batch_rows,
+                                  args.financial_year)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    rate = rows / seconds * 60 if seconds else 0
+    print(f"Computed {rows:,} rows in {seconds:.2f}s ({rate:,.0f} rows/minute)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
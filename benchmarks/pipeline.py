@@ -0,0 +1,196 @@
+"""Offline latency benchmark for the extraction, tax and advisor flows.
+
+    python benchmarks/pipeline.py --runs 50
+    python benchmarks/pipeline.py --latency 0.8 --jitter 0.4 --failure-rate 0.05
+    python benchmarks/pipeline.py --json results.json
+    python benchmarks/pipeline.py --baseline results.json --tolerance 0.25
+
+Model calls go to the replay backend (replay_model.py), so nothing here
+touches the network. PDF stages use the bundled sample Form 16; parsing, tax
+and ITR-1 stages also run over a synthetic corpus of model responses and
+extracted records. Reports p50/p95 per stage. With --baseline, exits with
+status 1 when any stage's p50 is slower than the baseline by more than the
+tolerance.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from form16 import (EXTRACTION_CONFIG, FORM16_FIELDS, SYSTEM_PROMPT, build_itr1_json, dump_json_bytes,  # noqa: E402
+                    parse_model_json, read_pdf_pages, reduce_form16_pages, validate_form16)
+from form16_record import Form16Record  # noqa: E402
+from form16_rules import extract_with_rules  # noqa: E402
+from replay_model import InjectedFailure, ReplayModel, load_recording  # noqa: E402
+from tax_pipeline import compute_tax, run_pipeline  # noqa: E402
+
+SAMPLE_PDF = os.path.join(ROOT, "1655725194_sampleform16 (1).pdf")
+RECORDING = os.path.join(ROOT, "benchmarks", "replay_responses.json")
+ADVISOR_PROMPT = "You are an expert Indian tax advisor. Answer the following tax-related question thoroughly and accurately: "
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def synthetic_records(count, seed):
+    """Random extracted-field records shaped like model output."""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        record = {field: str(rng.choice((0, 0, rng.randrange(0, 200000)))) for field in FORM16_FIELDS}
+        record["salary_income"] = str(rng.randrange(300000, 5000000))
+        record["deduction_80C"] = str(rng.randrange(0, 200000))
+        records.append(record)
+    return records
+
+
+def synthetic_responses(records, seed):
+    """Model responses for `records`, wrapped the ways Gemini tends to wrap them."""
+    rng = random.Random(seed)
+    wrappers = (
+        "{}",
+        "```json\n{}\n```",
+        "Here is the extracted data:\n```json\n{}\n```\nLet me know if you need anything else.",
+    )
+    return [rng.choice(wrappers).format(json.dumps(record, indent=2)) for record in records]
+
+
+def time_stage(func, inputs):
+    """Runs func over inputs, returning (per-call seconds, failure count)."""
+    samples, failures = [], 0
+    for item in inputs:
+        started = time.perf_counter()
+        try:
+            func(item)
+        except InjectedFailure:
+            failures += 1
+        samples.append(time.perf_counter() - started)
+    return samples, failures
+
+
+def stream_advisor(model, question):
+    """Returns (first chunk seconds, total seconds) for one streamed answer."""
+    started = time.perf_counter()
+    first = None
+    for chunk in model.generate_content(ADVISOR_PROMPT + question, stream=True):
+        if first is None and chunk.parts:
+            first = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return (total if first is None else first), total
+
+
+def run(args):
+    with open(SAMPLE_PDF, "rb") as f:
+        pdf_bytes = f.read()
+    pages = read_pdf_pages(io.BytesIO(pdf_bytes), stop_when_complete=True)
+    text = "\n".join(pages) + "\n"
+    prompt_text, _ = reduce_form16_pages(pages)
+    model = ReplayModel(load_recording(RECORDING), latency=args.latency, jitter=args.jitter,
+                        chunk_latency=args.chunk_latency, failure_rate=args.failure_rate, seed=args.seed)
+
+    records = synthetic_records(args.corpus_size, args.seed)
+    responses = synthetic_responses(records, args.seed)
+    parsed = [parse_model_json(response) for response in responses]
+    records = [Form16Record.from_dict(data) for data in parsed]
+    results = [compute_tax(record) for record in records]
+    repeat = range(args.runs)
+
+    def model_extract(_):
+        response = model.generate_content(SYSTEM_PROMPT + "\n\n" + prompt_text, generation_config=EXTRACTION_CONFIG)
+        return validate_form16(parse_model_json(response.text))
+
+    stages = {
+        "pdf_text (early stop)": (lambda _: read_pdf_pages(io.BytesIO(pdf_bytes), stop_when_complete=True), repeat),
+        "pdf_text (all pages)": (lambda _: read_pdf_pages(io.BytesIO(pdf_bytes)), repeat),
+        "rules": (lambda _: extract_with_rules(text), repeat),
+        "prompt_reduce": (lambda _: reduce_form16_pages(pages), repeat),
+        "model_extract (replay)": (model_extract, repeat),
+        "parse_model_json": (parse_model_json, responses),
+        "validate_form16": (validate_form16, parsed),
+        "form16_record": (Form16Record.from_dict, parsed),
+        "compute_tax": (compute_tax, records),
+        "itr1_json": (lambda i: dump_json_bytes(build_itr1_json(records[i], results[i])), range(len(records))),
+        "pipeline (sample pdf)": (lambda _: run_pipeline(pdf_bytes), repeat),
+    }
+
+    report = {}
+    for name, (func, inputs) in stages.items():
+        samples, failures = time_stage(func, inputs)
+        report[name] = {"p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95),
+                        "n": len(samples), "failures": failures}
+
+    first_tokens, totals, failures = [], [], 0
+    for _ in repeat:
+        try:
+            first, total = stream_advisor(model, "What can I claim under Section 80C?")
+        except InjectedFailure:
+            failures += 1
+            continue
+        first_tokens.append(first)
+        totals.append(total)
+    for name, samples in (("advisor first chunk", first_tokens), ("advisor total", totals)):
+        if samples:
+            report[name] = {"p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95),
+                            "n": len(samples), "failures": failures}
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"{'stage':<26} {'p50 ms':>10} {'p95 ms':>10} {'n':>6} {'fail':>5}" + ("  vs baseline p50" if baseline else ""))
+    for name, row in report.items():
+        line = f"{name:<26} {row['p50'] * 1000:10.2f} {row['p95'] * 1000:10.2f} {row['n']:6d} {row['failures']:5d}"
+        if baseline and name in baseline and baseline[name]["p50"]:
+            line += f"  {row['p50'] / baseline[name]['p50'] - 1:+.0%}"
+        print(line)
+
+
+def regressions(report, baseline, tolerance):
+    return [
+        name for name, row in report.items()
+        if name in baseline and row["p50"] > baseline[name]["p50"] * (1 + tolerance)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=30, help="Repetitions of the sample-PDF and model stages")
+    parser.add_argument("--corpus-size", type=int, default=500, help="Synthetic records and responses")
+    parser.add_argument("--latency", type=float, default=0.0, help="Replay model delay before responding (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random replay delay, up to this many seconds")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Delay between streamed chunks (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of replay calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare against a report written earlier with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline:
+        slower = regressions(report, baseline, args.tolerance)
+        if slower:
+            print(f"Regressed by more than {args.tolerance:.0%}: {', '.join(slower)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
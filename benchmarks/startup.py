@@ -0,0 +1,108 @@
+"""Cold-start and rerun benchmark for the app.
+
+    python benchmarks/startup.py --runs 5
+
+Each import measurement runs in a fresh interpreter. "lazy" is every module
+that tax.py's first script run actually loads besides Streamlit (found by
+running it once), optimiser and NumPy included; "eager" adds the PDF and
+LLM libraries that tax.py used to load up front. The app rows run
+tax.py under Streamlit's AppTest.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER_IMPORTS = ("pypdf", "google.generativeai")
+
+
+def app_first_run_imports():
+    """Returns the top-level modules, other than Streamlit's, that tax.py's first run imports."""
+    code = (
+        "import sys; from streamlit.testing.v1 import AppTest; "
+        "app = AppTest.from_file('tax.py', default_timeout=60); before = set(sys.modules); app.run(); "
+        "names = {name.split('.')[0] for name in set(sys.modules) - before}; "
+        "print(' '.join(sorted(name for name in names if getattr(sys.modules.get(name), '__spec__', None))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return [name for name in output.split() if not name.startswith("_") and name != "streamlit"]
+
+
+def time_import(statement, runs):
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def time_app(runs):
+    """Returns (first run seconds, list of rerun seconds) for tax.py."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "tax.py"), default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+
+    reruns = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - started)
+    return first, reruns
+
+
+def time_model_init():
+    """Returns (first build seconds, rebuild seconds) for the Gemini client."""
+    sys.path.insert(0, ROOT)
+    from tax_pipeline import create_model
+
+    started = time.perf_counter()
+    create_model("benchmark")
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    create_model("benchmark")
+    return first, time.perf_counter() - started
+
+
+def _row(name, samples):
+    print(f"{name:<28} {statistics.median(samples) * 1000:9.1f} ms  (min {min(samples) * 1000:.1f}, n={len(samples)})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app_imports = app_first_run_imports()
+    imports = {
+        "lazy": "import " + ", ".join(app_imports),
+        "eager": "import " + ", ".join(app_imports + [name for name in EAGER_IMPORTS if name not in app_imports]),
+    }
+    results = {name: time_import(statement, args.runs) for name, statement in imports.items()}
+    for name, samples in results.items():
+        _row(f"import ({name})", samples)
+    gain = statistics.median(results["eager"]) - statistics.median(results["lazy"])
+    print(f"{'cold-start import gain':<28} {gain * 1000:9.1f} ms")
+
+    first, second = time_model_init()
+    print(f"{'model client, first build':<28} {first * 1000:9.1f} ms")
+    print(f"{'model client, rebuilt':<28} {second * 1000:9.1f} ms  (saved per call by the broker's client pool)")
+
+    first, reruns = time_app(args.runs)
+    print(f"{'app first run':<28} {first * 1000:9.1f} ms")
+    _row("app rerun", reruns)
+
+
+if __name__ == "__main__":
+    main()
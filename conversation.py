@@ -0,0 +1,95 @@
+"""Bounded conversation context for the Tax Advisor."""
+import re
+
+from form16 import estimate_tokens
+
+FOLLOW_UP_WORDS = {"it", "its", "that", "this", "those", "these", "they", "them", "above", "same", "previous", "earlier"}
+FOLLOW_UP_OPENERS = ("and ", "also ", "what about ", "how about ", "then ", "so ")
+
+
+def is_follow_up(question):
+    """Whether a question leans on earlier turns, so its answer depends on context."""
+    text = " ".join(re.sub(r"[^a-z0-9]+", " ", question.lower()).split())
+    return text.startswith(FOLLOW_UP_OPENERS) or bool(FOLLOW_UP_WORDS.intersection(text.split()))
+
+
+def _first_sentence(text, limit):
+    text = " ".join(text.split())
+    match = re.search(r"[.!?](\s|$)", text)
+    if match:
+        text = text[:match.end()].strip()
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+class ConversationMemory:
+    """Rolling window of recent messages plus a condensed summary of older ones.
+
+    `messages` is the displayed chat history and is capped at
+    `max_stored_messages`. Messages that fall out of the last `window_messages`
+    are folded into a one-line-per-message summary, and the prompt built from
+    both is kept within `max_context_tokens`.
+    """
+
+    def __init__(self, messages=None, window_messages=6, max_context_tokens=1500,
+                 max_summary_tokens=400, max_stored_messages=100):
+        self.messages = messages if messages is not None else []
+        self.window_messages = window_messages
+        self.max_context_tokens = max_context_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.max_stored_messages = max(max_stored_messages, window_messages)
+        self.summary = []
+        self.dropped_messages = 0
+        self._summarized = 0
+        self._fold()
+
+    def _fold(self):
+        while len(self.messages) - self._summarized > self.window_messages:
+            message = self.messages[self._summarized]
+            if message["role"] == "user":
+                self.summary.append("User asked: " + _first_sentence(message["content"], 160))
+            else:
+                self.summary.append("Advisor answered: " + _first_sentence(message["content"], 240))
+            self._summarized += 1
+
+        while len(self.summary) > 1 and estimate_tokens("\n".join(self.summary)) > self.max_summary_tokens:
+            del self.summary[0]
+
+        overflow = len(self.messages) - self.max_stored_messages
+        if overflow > 0:
+            del self.messages[:overflow]
+            self._summarized -= overflow
+            self.dropped_messages += overflow
+
+    def append(self, message):
+        self.messages.append(message)
+        self._fold()
+
+    def window(self):
+        return self.messages[self._summarized:]
+
+    def build_prompt(self, instruction, question):
+        """Returns the model prompt for `question` with as much context as the budget allows."""
+        prompt = instruction + question
+        budget = self.max_context_tokens - estimate_tokens(prompt)
+
+        recent = [
+            ("User: " if message["role"] == "user" else "Advisor: ") + message["content"]
+            for message in self.window()
+        ]
+        while recent and estimate_tokens("\n".join(recent)) > budget:
+            recent.pop(0)
+        budget -= estimate_tokens("\n".join(recent))
+
+        summary = list(self.summary)
+        while summary and estimate_tokens("\n".join(summary)) > budget:
+            summary.pop(0)
+
+        if not recent and not summary:
+            return prompt
+
+        context = []
+        if summary:
+            context.append("Summary of the earlier conversation:\n" + "\n".join(summary))
+        if recent:
+            context.append("Recent conversation:\n" + "\n".join(recent))
+        return "\n\n".join(context) + "\n\n" + prompt
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OcrCache:
+    """Persistent cache of OCR text for scanned pages, keyed by a hash of the page images.
+
+    Kept in its own table with its own size budget, so OCR text never
+    competes with extraction results. An empty text is a valid result: a
+    page that OCR could not read is not OCRed again.
+    """
+
+    def __init__(self, path, max_bytes=16 * 1024 * 1024, max_age_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ocr_pages (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ocr_pages_accessed ON ocr_pages (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Returns the cached OCR text of a page, or None."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT text, created_at FROM ocr_pages WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                if row is not None:
+                    conn.execute("DELETE FROM ocr_pages WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute("UPDATE ocr_pages SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, text):
+        """Stores the OCR text of a page and evicts expired or least recently used pages."""
+        now = time.time()
+        size = len(text.encode("utf-8")) + len(key)
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO ocr_pages VALUES (?, ?, ?, ?, ?)", (key, text, size, now, now))
+            conn.execute("DELETE FROM ocr_pages WHERE created_at < ?", (now - self.max_age_seconds,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old_key, old_size in conn.execute(
+                "SELECT key, size FROM ocr_pages ORDER BY accessed_at ASC"
+            ).fetchall():
+                conn.execute("DELETE FROM ocr_pages WHERE key = ?", (old_key,))
+                total -= old_size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM ocr_pages")
+
+
+class ExtractionCache:
+    """Persistent cache of Form 16 extraction results keyed by PDF content.
+
+    OCR text of scanned pages is cached alongside, in the same file, by
+    `ocr_pages` (an OcrCache).
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_age_seconds=30 * 24 * 3600,
+                 ocr_max_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.ocr_pages = OcrCache(path, ocr_max_bytes, max_age_seconds)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS extractions (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(pdf_bytes, prompt, model_name, version=0):
+        """Builds the cache key from the PDF bytes, the prompt, the model name and the pipeline version."""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        return hashlib.sha256(f"{pdf_hash}:{prompt_hash}:{model_name}:{version}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns (text, data) for a cached extraction, or None."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT text, data, created_at FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.max_age_seconds:
+                if row is not None:
+                    conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0], json.loads(row[1])
+
+    def put(self, key, text, data):
+        """Stores an extraction and evicts expired or least recently used entries."""
+        now = time.time()
+        data_json = json.dumps(data)
+        size = len(text.encode("utf-8")) + len(data_json.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, data_json, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - self.max_age_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute(
+            "SELECT key, size FROM extractions ORDER BY accessed_at ASC"
+        ).fetchall():
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM extractions")
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
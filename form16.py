@@ -0,0 +1,340 @@
+import json
+import re
+
+MODEL_NAME = "gemini-1.5-flash"
+
+SYSTEM_PROMPT = """
+You are an expert in Indian taxation. Extract tax details from Form 16 PDFs.
+Your task is to extract the following information and return it in a strict JSON format:
+{
+  {
+  "salary_income": "numeric value",
+  "interest_income": "numeric value",
+  "rental_income": "numeric value",
+  "digital_assets_income": "numeric value",
+  "exempt_allowances": "numeric value",
+  "home_loan_self": "numeric value",
+  "home_loan_letout": "numeric value",
+  "other_income": "numeric value",
+  "deduction_80C": "numeric value",
+  "deduction_80CCC": "numeric value",
+  "deduction_80CCD1": "numeric value",
+  "deduction_80CCD1B": "numeric value",
+  "deduction_80CCD2": "numeric value",
+  "deduction_80D": "numeric value",
+  "deduction_80DD": "numeric value",
+  "deduction_80DDB": "numeric value",
+  "deduction_80E": "numeric value",
+  "deduction_80EE": "numeric value",
+  "deduction_80EEA": "numeric value",
+  "deduction_80G": "numeric value",
+  "deduction_80GG": "numeric value",
+  "deduction_80GGA": "numeric value",
+  "deduction_80GGC": "numeric value",
+  "deduction_80TTA": "numeric value",
+  "deduction_80TTB": "numeric value",
+  "deduction_80U": "numeric value",
+  "other_deductions": "numeric value",
+  "gross_salary": "numeric value",
+  "value_of_perquisites": "numeric value",
+  "profits_in_lieu_of_salary": "numeric value",
+  "allowances_exempt_under_section_10": "numeric value",
+  "deductions_under_section_16": "numeric value",
+  "income_chargeable_under_head_salaries": "numeric value",
+  "income_from_house_property": "numeric value",
+  "income_from_other_sources": "numeric value",
+  "gross_total_income": "numeric value",
+  "deductions_under_chapter_VI_A": "numeric value",
+  "total_income": "numeric value",
+  "tax_on_total_income": "numeric value",
+  "rebate_under_section_87A": "numeric value",
+  "surcharge": "numeric value",
+  "health_and_education_cess": "numeric value",
+  "relief_under_section_89": "numeric value",
+  "net_tax_payable": "numeric value"
+}
+
+}
+Replace 'numeric value' with the actual numbers found in the document. Use 0 for any fields not found.
+Only return the JSON - no explanation or other text.
+"""
+
+FORM16_FIELDS = tuple(re.findall(r'"(\w+)": "numeric value"', SYSTEM_PROMPT))
+
+# Typed schema for the fields SYSTEM_PROMPT asks for, in the response-schema
+# subset of OpenAPI that Gemini's JSON mode accepts.
+FORM16_SCHEMA = {
+    "type": "object",
+    "properties": {name: {"type": "number"} for name in FORM16_FIELDS},
+    "required": list(FORM16_FIELDS),
+}
+
+EXTRACTION_CONFIG = {"response_mime_type": "application/json", "response_schema": FORM16_SCHEMA}
+
+
+# Part B figures that the prompt needs; once every marker has been seen the
+# remaining pages are break-up tables and verification text.
+PART_B_MARKERS = (
+    re.compile(r"gross\s+salary", re.IGNORECASE),
+    re.compile(r"chapter\s+VI-?A", re.IGNORECASE),
+    re.compile(r"total\s+taxable\s+income", re.IGNORECASE),
+    re.compile(r"net\s+tax\s+payable", re.IGNORECASE),
+)
+
+
+class PdfReadError(Exception):
+    """Raised when a PDF cannot be parsed."""
+
+
+def iter_pdf_pages(source):
+    """Yields the text of each page, parsing a page only when it is consumed."""
+    # pypdf is imported on first use so that starting the app does not pay for it.
+    import pypdf
+
+    try:
+        reader = pypdf.PdfReader(source)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+    except pypdf.errors.PdfReadError as e:
+        raise PdfReadError(str(e)) from e
+
+
+def read_pdf_pages(source, stop_when_complete=False):
+    """Extracts the text of each page of a PDF path or file-like object.
+
+    With stop_when_complete, reading stops after the page on which the last
+    of the Part B markers is found.
+    """
+    return take_pages(iter_pdf_pages(source), stop_when_complete)
+
+
+def take_pages(page_iter, stop_when_complete=False):
+    """Reads pages from an iter_pdf_pages iterator, as read_pdf_pages does.
+
+    After an early stop the iterator is left at the next page, so the rest
+    of the document can still be read from it.
+    """
+    pages = []
+    missing = list(PART_B_MARKERS) if stop_when_complete else []
+    for page_text in page_iter:
+        pages.append(page_text)
+        if missing:
+            missing = [marker for marker in missing if not marker.search(page_text)]
+            if not missing:
+                break
+    return pages
+
+
+# A page is sent to the model only if it mentions one of the fields in SYSTEM_PROMPT.
+RELEVANT_ANCHORS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"gross\s+salary",
+    r"section\s+1[067]\b",
+    r"standard\s+deduction",
+    r"chapter\s+VI-?A",
+    r"\b80(?:C|CCC|CCD|D|DD|DDB|E|EE|EEA|G|GG|GGA|GGC|TTA|TTB|U)\b",
+    r"house\s+property",
+    r"other\s+sources",
+    r"total\s+(?:taxable\s+)?income",
+    r"rebate\s+under\s+section\s+87A",
+    r"surcharge",
+    r"education\s+cess",
+    r"relief\s+under\s+section\s+89",
+    r"net\s+tax\s+payable",
+))
+
+NOISE_LINES = tuple(re.compile(pattern) for pattern in (
+    r"^Page \d+ of \d+$",
+    r"^[xy]+(?: [xy]+)*$",
+    r"^\S+@\S+\.\S+$",
+    r"^\+[\d()\- ]+$",
+))
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) for prompt-size reporting."""
+    return (len(text) + 3) // 4
+
+
+def relevant_pages(pages):
+    """The pages that mention a field in SYSTEM_PROMPT, or all pages if none do."""
+    kept = [page for page in pages if any(anchor.search(page) for anchor in RELEVANT_ANCHORS)]
+    return kept or pages
+
+
+def compact_page(page):
+    """Collapses whitespace and drops page furniture such as page numbers and contact lines."""
+    lines = []
+    for line in page.splitlines():
+        line = " ".join(line.split())
+        if line and not any(noise.match(line) for noise in NOISE_LINES):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def reduce_form16_pages(pages):
+    """Keeps only the pages relevant to SYSTEM_PROMPT and compacts their whitespace.
+
+    Returns (text, stats) where stats reports page counts and estimated tokens
+    before and after the reduction.
+    """
+    kept = relevant_pages(pages)
+    text = "\n".join(filter(None, (compact_page(page) for page in kept)))
+
+    stats = {
+        "pages": len(pages),
+        "pages_kept": len(kept),
+        "tokens_before": estimate_tokens("\n".join(pages)),
+        "tokens_after": estimate_tokens(text),
+    }
+    return text, stats
+
+
+AMOUNT = re.compile(r"^\s*(?:₹|Rs\.?|INR)?\s*(-?\d[\d,]*(?:\.\d+)?|-?\.\d+)\s*(?:/-)?\s*$", re.IGNORECASE)
+NUMERIC_FIELDS = frozenset(FORM16_FIELDS)
+
+
+def coerce_amount(value):
+    """Turns an amount such as "₹1,50,000.00" into 150000; other values are returned unchanged."""
+    if value is None or value == "":
+        return 0
+    if not isinstance(value, str):
+        return value
+    if value.isascii() and value.isdigit():
+        return int(value)
+    match = AMOUNT.match(value)
+    if not match:
+        return value
+    number = float(match.group(1).replace(",", ""))
+    return int(number) if number.is_integer() else number
+
+
+def _coerce_fields(pairs):
+    return {key: coerce_amount(value) if key in NUMERIC_FIELDS else value for key, value in pairs}
+
+
+_DECODER = json.JSONDecoder(object_pairs_hook=_coerce_fields, strict=False)
+
+
+def parse_model_json(text):
+    """Parses the first complete JSON object out of a model response.
+
+    Each top-level "{" is tried in turn with the C decoder's raw_decode,
+    which balances braces and strings in a single pass and stops at the end
+    of the object. Code fences, leading or trailing prose and a doubled outer
+    brace ("{ {") are therefore skipped, and numeric Form 16 fields are
+    coerced to numbers while decoding. After a failed attempt the search
+    resumes where decoding failed, so an object nested inside a malformed
+    one is never returned on its own. Raises ValueError if there is no object.
+    """
+    error = None
+    position = text.find("{")
+    while position >= 0:
+        try:
+            return _DECODER.raw_decode(text, position)[0]
+        except json.JSONDecodeError as e:
+            error = error or e
+            position = text.find("{", max(e.pos, position + 1))
+    raise error or ValueError("No JSON object found in the model response")
+
+
+def compile_validator(schema):
+    """Compiles an object schema of number properties into a validating function.
+
+    The function takes a parsed response and returns a new dict with every
+    property as an int or float; properties not in the schema are kept. It
+    raises ValueError if the response has none of the properties (a refusal
+    such as {"error": ...}), is missing a required one, or has a value that
+    is not a number.
+    """
+    numeric = tuple(name for name, spec in schema["properties"].items() if spec.get("type") in ("number", "integer"))
+    required = tuple(schema.get("required", ()))
+
+    def validate(data):
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        if not any(name in data for name in schema["properties"]):
+            raise ValueError("The response has none of the expected fields")
+        missing = [name for name in required if name not in data]
+        if missing:
+            raise ValueError("Missing fields " + ", ".join(missing))
+        result = dict(data)
+        invalid = []
+        for name in numeric:
+            value = coerce_amount(data.get(name))
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                invalid.append(f"{name}={data.get(name)!r}")
+            else:
+                result[name] = int(value) if float(value).is_integer() else value
+        if invalid:
+            raise ValueError("Non-numeric values for " + ", ".join(invalid))
+        return result
+
+    return validate
+
+
+validate_form16 = compile_validator(FORM16_SCHEMA)
+
+
+def dump_json_bytes(document, compact=False):
+    """Serialises a JSON document to UTF-8 bytes.
+
+    The default output matches json.dump(..., indent=4). Compact output has no
+    whitespace and uses orjson when it is installed.
+    """
+    if not compact:
+        return json.dumps(document, indent=4).encode("utf-8")
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(document, separators=(",", ":")).encode("utf-8")
+    return orjson.dumps(document)
+
+
+def build_itr1_json(extracted_data, calculation_results=None):
+    """Builds the ITR-1 JSON document from extracted Form 16 data (a dict or Form16Record)."""
+    from form16_record import Form16Record
+
+    extracted_data = Form16Record.from_dict(extracted_data)
+    itr1_json = {
+        "ITR1_FORM_DATA": {
+            "Part_A_General_1": {
+                "AssesseeVerPAN": extracted_data.get("PAN", ""),
+                "FirstName": extracted_data.get("Name", ""),
+                "Address": extracted_data.get("Address", ""),
+                "MobileNo": extracted_data.get("Contact", "")
+            },
+            "Part_B_TI": {
+                "IncSalary": extracted_data["salary_income"],
+                "IncInterest": extracted_data["interest_income"],
+                "IncHouseProp": extracted_data["rental_income"],
+                "IncOther": extracted_data["other_income"],
+                "DigitalAssets": extracted_data["digital_assets_income"]
+            },
+            "Part_C_Deductions": {
+                "Section80C": extracted_data["deduction_80C"],
+                "Section80D": extracted_data["deduction_80D"],
+                "Section80EEA": extracted_data["deduction_80EEA"],
+                "Section80CCD2": extracted_data["deduction_80CCD2"],
+                "Section80TTA": extracted_data["deduction_80TTA"],
+                "Section80G": extracted_data["deduction_80G"],
+                "Section80CCD": extracted_data["deduction_80CCD"],
+                "OtherDeductions": extracted_data["other_deductions"]
+            },
+            "ExemptAllowances": extracted_data["exempt_allowances"],
+            "HomeLoanInterestSelfOccupied": extracted_data["home_loan_self"],
+            "HomeLoanInterestLetOut": extracted_data["home_loan_letout"]
+        }
+    }
+
+    if calculation_results:
+        itr1_json["Tax_Calculation"] = {
+            "TotalIncome": calculation_results["total_income"],
+            "TotalDeductions": calculation_results["total_deductions"],
+            "TaxableIncomeOldRegime": calculation_results["taxable_income_old"],
+            "TaxableIncomeNewRegime": calculation_results["taxable_income_new"],
+            "TaxPayableOldRegime": calculation_results["tax_old"],
+            "TaxPayableNewRegime": calculation_results["tax_new"],
+            "RecommendedRegime": calculation_results["recommended_regime"]
+        }
+
+    return itr1_json
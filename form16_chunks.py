@@ -0,0 +1,146 @@
+"""Map-reduce extraction for long Form 16 documents.
+
+The relevant pages are split into chunks under a token budget, each chunk is
+extracted by its own concurrent model call, and the partial results are
+merged field by field. End-to-end latency is then that of the slowest chunk
+rather than of the whole document.
+"""
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from form16 import (EXTRACTION_CONFIG, FORM16_FIELDS, PART_B_MARKERS, SYSTEM_PROMPT, compact_page,
+                    estimate_tokens, parse_model_json, relevant_pages, validate_form16)
+from metrics import METRICS
+
+CHUNK_TOKENS = 6000
+
+PART_B_HEADING = re.compile(r"\bpart\s*-?\s*b\b", re.IGNORECASE)
+
+# Figures that Part B states as totals. Annexures and Part A can repeat them as
+# partial or quarterly amounts, so the chunk that looks most like Part B wins.
+PART_B_TOTALS = frozenset((
+    "gross_salary",
+    "value_of_perquisites",
+    "profits_in_lieu_of_salary",
+    "allowances_exempt_under_section_10",
+    "deductions_under_section_16",
+    "income_chargeable_under_head_salaries",
+    "income_from_house_property",
+    "income_from_other_sources",
+    "gross_total_income",
+    "deductions_under_chapter_VI_A",
+    "total_income",
+    "tax_on_total_income",
+    "rebate_under_section_87A",
+    "surcharge",
+    "health_and_education_cess",
+    "relief_under_section_89",
+    "net_tax_payable",
+))
+
+
+def part_b_score(text):
+    """How strongly a chunk looks like the Part B computation."""
+    return sum(1 for marker in PART_B_MARKERS if marker.search(text)) + (2 if PART_B_HEADING.search(text) else 0)
+
+
+def chunk_form16_pages(pages, max_tokens=CHUNK_TOKENS):
+    """Groups the compacted relevant pages into consecutive chunks of about max_tokens each.
+
+    A page larger than the budget is split between lines.
+    """
+    pieces = []
+    for page in relevant_pages(pages):
+        text = compact_page(page)
+        if estimate_tokens(text) <= max_tokens:
+            pieces.append(text)
+            continue
+        lines, size = [], 0
+        for line in text.splitlines():
+            if lines and size + estimate_tokens(line) > max_tokens:
+                pieces.append("\n".join(lines))
+                lines, size = [], 0
+            lines.append(line)
+            size += estimate_tokens(line) + 1
+        if lines:
+            pieces.append("\n".join(lines))
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and size + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def merge_partial_extractions(partials):
+    """Merges (data, part_b_score) pairs from the chunks into one record.
+
+    Zero means "not found in this chunk". For Part B totals only the chunks
+    with the highest Part B score are considered. Among the remaining
+    non-zero values the most frequent wins, and ties go to the larger value.
+    Returns (merged, conflicts), where conflicts names the fields on which
+    the chunks disagreed.
+    """
+    merged, conflicts = {}, []
+    for field in FORM16_FIELDS:
+        candidates = [(data[field], score) for data, score in partials if data.get(field)]
+        if not candidates:
+            merged[field] = 0
+            continue
+        if field in PART_B_TOTALS:
+            best = max(score for _, score in candidates)
+            candidates = [candidate for candidate in candidates if candidate[1] == best]
+        counts = Counter(value for value, _ in candidates)
+        if len(counts) > 1:
+            conflicts.append(field)
+        merged[field] = max(counts, key=lambda value: (counts[value], value))
+    return merged, conflicts
+
+
+def extract_chunked(pages, model, max_tokens=CHUNK_TOKENS, max_workers=4):
+    """Extracts Form 16 fields with one concurrent model call per chunk.
+
+    Returns (data, stats). A chunk whose call fails or whose response cannot
+    be parsed is left out of the merge; the first error is raised only if
+    every chunk fails.
+    """
+    chunks = chunk_form16_pages(pages, max_tokens)
+
+    def extract(chunk):
+        prompt = SYSTEM_PROMPT + "\n\n" + chunk
+        METRICS.inc("model_calls_total", kind="extract_chunk")
+        METRICS.inc("model_prompt_tokens_total", estimate_tokens(prompt), kind="extract_chunk")
+        started = time.perf_counter()
+        try:
+            response = model.generate_content(prompt, generation_config=EXTRACTION_CONFIG)
+        except Exception as e:
+            METRICS.inc("model_errors_total", kind="extract_chunk")
+            return e
+        finally:
+            METRICS.observe("model_chunk", time.perf_counter() - started)
+        response_text = response.text if response else ""
+        METRICS.inc("model_response_tokens_total", estimate_tokens(response_text), kind="extract_chunk")
+        try:
+            return validate_form16(parse_model_json(response_text)), part_b_score(chunk)
+        except ValueError as e:
+            METRICS.inc("extraction_failures_total", reason="chunk_parse")
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        results = list(pool.map(extract, chunks))
+
+    partials = [result for result in results if not isinstance(result, Exception)]
+    errors = [result for result in results if isinstance(result, Exception)]
+    if not partials:
+        raise errors[0] if errors else ValueError("The document has no text to extract")
+
+    data, conflicts = merge_partial_extractions(partials)
+    return data, {"chunks": len(chunks), "failed_chunks": len(errors), "conflicts": conflicts}
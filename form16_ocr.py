@@ -0,0 +1,151 @@
+"""OCR fallback for scanned Form 16 pages.
+
+Pages whose text layer is empty are usually a single scanned image. Those
+images are taken straight out of the PDF with pypdf, resampled to OCR_DPI in
+greyscale and read with Tesseract, one thread per page, so a scanned
+document costs about as long as its slowest page. pytesseract runs the
+tesseract binary as a subprocess, so threads are enough to use every core,
+and no worker processes are forked from inside the app server. Pages that
+have text are left alone. OCR output is cached by a hash of the page images
+(extraction_cache.OcrCache), so the same scan is read only once.
+
+Tesseract is optional: pytesseract and the tesseract binary must be
+installed. Without them ocr_available() is False and pages stay empty.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+OCR_DPI = int(os.environ.get("TAX_ASSISTANT_OCR_DPI", "300"))
+OCR_LANG = os.environ.get("TAX_ASSISTANT_OCR_LANG", "eng")
+
+# Images smaller than this on either side are logos or signatures, not scans.
+MIN_IMAGE_PIXELS = 200
+
+_available = None
+
+
+def ocr_available():
+    """Whether pytesseract and the tesseract binary can be used."""
+    global _available
+    if _available is None:
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+        except Exception:
+            _available = False
+        else:
+            _available = True
+    return _available
+
+
+def scanned_page_images(pdf_bytes, page_numbers):
+    """Returns {page number: (page width in points, [encoded image bytes])} for the given pages."""
+    import pypdf
+
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    images = {}
+    for number in page_numbers:
+        page = reader.pages[number]
+        try:
+            page_images = [image.data for image in page.images]
+        except Exception:
+            # An image filter pypdf cannot decode; OCR cannot help with that page either.
+            page_images = []
+        if page_images:
+            images[number] = (float(page.mediabox.width), page_images)
+    return images
+
+
+def _prepare(data, page_width):
+    """Decodes one page image to greyscale at OCR_DPI, or returns None for small images."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if min(image.size) < MIN_IMAGE_PIXELS:
+        return None
+    image = image.convert("L")
+    dpi = image.width / (page_width / 72) if page_width else OCR_DPI
+    scale = OCR_DPI / dpi
+    # Resampling is skipped when the scan is already close to the target;
+    # more pixels than that only slow Tesseract down.
+    if abs(scale - 1) > 0.1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    return image
+
+
+def ocr_page(page_width, images, lang=OCR_LANG):
+    """OCRs the images of one page, top to bottom as they appear in the PDF."""
+    import pytesseract
+
+    texts = []
+    for data in images:
+        image = _prepare(data, page_width)
+        if image is not None:
+            texts.append(pytesseract.image_to_string(image, lang=lang))
+    return "\n".join(text.strip() for text in texts if text.strip())
+
+
+def _ocr_page_or_none(page_width, images):
+    # One unreadable page (a TesseractError, an image PIL cannot decode, a
+    # Tesseract timeout) should not cost the OCR text of the others.
+    try:
+        return ocr_page(page_width, images)
+    except Exception:
+        return None
+
+
+def page_key(page_width, images, lang=OCR_LANG):
+    digest = hashlib.sha256(f"ocr:{OCR_DPI}:{lang}:{page_width}".encode("utf-8"))
+    for data in images:
+        digest.update(hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def ocr_blank_pages(pdf_bytes, pages, cache=None, max_workers=None, first_page=0):
+    """Fills in pages that have no text layer with OCR text.
+
+    `cache` is an OcrCache. Returns (pages, stats). stats counts the blank
+    pages, those read from the cache, those OCRed and those OCR failed on.
+    Pages stay empty when OCR is unavailable, a page holds no usable image
+    or OCR fails; a failed page is not cached, so it is tried again next
+    time. max_workers=0 OCRs
+    the pages one after another on the calling thread. Pages before
+    first_page have already been through OCR and are left alone.
+    """
+    blank = [number for number, text in enumerate(pages) if number >= first_page and not text.strip()]
+    stats = {"blank_pages": len(blank), "cached_pages": 0, "ocr_pages": 0, "failed_pages": 0}
+    if not blank or not ocr_available():
+        return pages, stats
+
+    pages = list(pages)
+    todo = {}
+    for number, (page_width, images) in scanned_page_images(pdf_bytes, blank).items():
+        key = page_key(page_width, images) if cache else None
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            pages[number] = cached
+            stats["cached_pages"] += 1
+        else:
+            todo[number] = (key, page_width, images)
+
+    if len(todo) > 1 and max_workers != 0:
+        # Tesseract's own OpenMP threads would compete with the other pages.
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        with ThreadPoolExecutor(min(max_workers or os.cpu_count() or 1, len(todo))) as pool:
+            futures = {number: pool.submit(_ocr_page_or_none, page_width, images)
+                       for number, (_, page_width, images) in todo.items()}
+            texts = {number: future.result() for number, future in futures.items()}
+    else:
+        texts = {number: _ocr_page_or_none(page_width, images) for number, (_, page_width, images) in todo.items()}
+
+    for number, text in texts.items():
+        if text is None:
+            stats["failed_pages"] += 1
+            continue
+        pages[number] = text
+        stats["ocr_pages"] += 1
+        if cache:
+            cache.put(todo[number][0], text)
+    return pages, stats
@@ -0,0 +1,224 @@
+"""Compact record of the amounts extracted from one Form 16.
+
+Amounts are parsed and truncated to whole rupees once, when the record is
+built, and stored in a fixed-layout int64 array, so reading a field is an
+index lookup instead of int(float(...)) on a string. Records are immutable:
+replace() returns a new record and copies the array only when an amount
+actually changes. Text fields such as PAN and Name are kept alongside in a
+dict that copies share until one of them is edited.
+"""
+import json
+import struct
+import sys
+from array import array
+
+from form16 import coerce_amount
+
+# The serialised layout: to_bytes stores amounts by their index here. It is
+# spelled out rather than derived from SYSTEM_PROMPT so that editing the prompt
+# cannot reorder it. New fields go at the end; never reorder or remove one.
+# deduction_80CCD is the employee NPS contribution as entered in the
+# calculator; the prompt asks for it split into 80CCD(1) and 80CCD(1B).
+RECORD_FIELDS = (
+    "salary_income",
+    "interest_income",
+    "rental_income",
+    "digital_assets_income",
+    "exempt_allowances",
+    "home_loan_self",
+    "home_loan_letout",
+    "other_income",
+    "deduction_80C",
+    "deduction_80CCC",
+    "deduction_80CCD1",
+    "deduction_80CCD1B",
+    "deduction_80CCD2",
+    "deduction_80D",
+    "deduction_80DD",
+    "deduction_80DDB",
+    "deduction_80E",
+    "deduction_80EE",
+    "deduction_80EEA",
+    "deduction_80G",
+    "deduction_80GG",
+    "deduction_80GGA",
+    "deduction_80GGC",
+    "deduction_80TTA",
+    "deduction_80TTB",
+    "deduction_80U",
+    "other_deductions",
+    "gross_salary",
+    "value_of_perquisites",
+    "profits_in_lieu_of_salary",
+    "allowances_exempt_under_section_10",
+    "deductions_under_section_16",
+    "income_chargeable_under_head_salaries",
+    "income_from_house_property",
+    "income_from_other_sources",
+    "gross_total_income",
+    "deductions_under_chapter_VI_A",
+    "total_income",
+    "tax_on_total_income",
+    "rebate_under_section_87A",
+    "surcharge",
+    "health_and_education_cess",
+    "relief_under_section_89",
+    "net_tax_payable",
+    "deduction_80CCD",
+)
+FIELD_INDEX = {name: index for index, name in enumerate(RECORD_FIELDS)}
+
+_HEADER = struct.Struct("<3sBH")
+_MAGIC = b"F16"
+_VERSION = 1
+_BITMAP_BYTES = (len(RECORD_FIELDS) + 7) // 8
+
+
+def _whole_rupees(name, value):
+    amount = coerce_amount(value)
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        raise ValueError(f"Non-numeric value for {name}: {value!r}")
+    return int(amount)
+
+
+class Form16Record:
+    """Immutable Form 16 amounts plus any text fields, with read-only dict-style access."""
+
+    __slots__ = ("_amounts", "_text")
+
+    def __init__(self, amounts=None, text=None):
+        self._amounts = amounts if amounts is not None else array("q", bytes(8 * len(RECORD_FIELDS)))
+        self._text = text or None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Parses a dict of extracted or entered values. A record is returned unchanged.
+
+        Missing and empty amounts become 0; ValueError names the first value
+        that is not an amount. Keys that are not amount fields are kept as text.
+        """
+        if isinstance(data, cls):
+            return data
+        amounts = array("q", bytes(8 * len(RECORD_FIELDS)))
+        text = {}
+        for name, value in data.items():
+            index = FIELD_INDEX.get(name)
+            if index is None:
+                text[name] = value
+            else:
+                amounts[index] = _whole_rupees(name, value)
+        return cls(amounts, text)
+
+    def __getitem__(self, name):
+        index = FIELD_INDEX.get(name)
+        if index is not None:
+            return self._amounts[index]
+        if self._text is not None and name in self._text:
+            return self._text[name]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        index = FIELD_INDEX.get(name)
+        if index is not None:
+            return self._amounts[index]
+        if self._text is not None:
+            return self._text.get(name, default)
+        return default
+
+    def __contains__(self, name):
+        return name in FIELD_INDEX or (self._text is not None and name in self._text)
+
+    def __iter__(self):
+        yield from RECORD_FIELDS
+        if self._text is not None:
+            yield from self._text
+
+    def __len__(self):
+        return len(RECORD_FIELDS) + (len(self._text) if self._text is not None else 0)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+    def to_dict(self):
+        data = dict(zip(RECORD_FIELDS, self._amounts))
+        if self._text is not None:
+            data.update(self._text)
+        return data
+
+    def __eq__(self, other):
+        if not isinstance(other, Form16Record):
+            return NotImplemented
+        return self._amounts == other._amounts and (self._text or {}) == (other._text or {})
+
+    __hash__ = None
+
+    def __repr__(self):
+        nonzero = {name: value for name, value in zip(RECORD_FIELDS, self._amounts) if value}
+        return f"Form16Record({nonzero!r}, text={self._text or {}!r})"
+
+    def replace(self, changes=None, **more):
+        """Returns a record with the given fields changed, or this record if nothing changes."""
+        changes = dict(changes or (), **more)
+        amounts, text = self._amounts, self._text
+        for name, value in changes.items():
+            index = FIELD_INDEX.get(name)
+            if index is None:
+                if text is None or text.get(name) != value:
+                    if text is self._text:
+                        text = dict(text or ())
+                    text[name] = value
+            else:
+                value = _whole_rupees(name, value)
+                if amounts[index] != value:
+                    if amounts is self._amounts:
+                        amounts = array("q", amounts)
+                    amounts[index] = value
+        if amounts is self._amounts and text is self._text:
+            return self
+        return Form16Record(amounts, text)
+
+    def to_bytes(self):
+        """Serialises the record: a header, a bitmap of non-zero amounts, those amounts, then any text as JSON."""
+        bitmap = 0
+        nonzero = array("q")
+        for index, value in enumerate(self._amounts):
+            if value:
+                bitmap |= 1 << index
+                nonzero.append(value)
+        if sys.byteorder != "little":
+            nonzero.byteswap()
+        text = json.dumps(self._text, separators=(",", ":"), ensure_ascii=False).encode() if self._text else b""
+        return (_HEADER.pack(_MAGIC, _VERSION, len(RECORD_FIELDS)) + bitmap.to_bytes(_BITMAP_BYTES, "little")
+                + nonzero.tobytes() + text)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Rebuilds a record written by to_bytes. Raises ValueError for anything else."""
+        try:
+            magic, version, count = _HEADER.unpack_from(blob)
+        except struct.error:
+            raise ValueError("Not a serialised Form16Record") from None
+        if magic != _MAGIC or version != _VERSION or count > len(RECORD_FIELDS):
+            raise ValueError("Not a serialised Form16Record, or one from an incompatible version")
+        # RECORD_FIELDS only grows at the end, so fields added since the record
+        # was written read as 0.
+        offset = _HEADER.size
+        bitmap_bytes = (count + 7) // 8
+        bitmap = int.from_bytes(blob[offset:offset + bitmap_bytes], "little")
+        offset += bitmap_bytes
+        stored = bin(bitmap).count("1")
+        nonzero = array("q", blob[offset:offset + 8 * stored])
+        if len(nonzero) != stored:
+            raise ValueError("Truncated Form16Record")
+        if sys.byteorder != "little":
+            nonzero.byteswap()
+        amounts = array("q", bytes(8 * len(RECORD_FIELDS)))
+        values = iter(nonzero)
+        for index in range(count):
+            if bitmap >> index & 1:
+                amounts[index] = next(values)
+        rest = blob[offset + 8 * stored:]
+        return cls(amounts, json.loads(rest) if rest else None)
@@ -0,0 +1,140 @@
+"""Rule-based extraction for Form 16s in the standard TRACES Part B layout.
+
+The patterns below match the text order pypdf produces for TRACES-generated
+certificates. Every value that is read is cross-checked against the
+arithmetic printed on the form (row 3 = 1(d) - 2(h), row 9 = 6 + 8, ...),
+so a layout the rules do not understand shows up as low confidence rather
+than wrong numbers.
+"""
+import re
+
+from form16 import FORM16_FIELDS
+from tax_engine import FINANCIAL_YEARS, rules_for
+
+NUM = r"(-?\d[\d,]*\.\d{2})"
+
+RULES = {
+    "salary_17_1": r"section\s+17\(1\)(?:\(a\))?\s+" + NUM,
+    "value_of_perquisites": r"Gross Salary.*?^\(b\)\s+" + NUM,
+    "profits_in_lieu_of_salary": r"section\s+17\(3\)[^\n]*?\s" + NUM,
+    "gross_salary": r"^\(d\)\s+Total\s+" + NUM,
+    "allowances_exempt_under_section_10": NUM + r"\(h\)",
+    "salary_from_current_employer": NUM + r"\s*3\.\s*Total amount of salary",
+    "standard_deduction": r"Deductions under section 16.*?\(a\)\s+" + NUM,
+    "entertainment_allowance": NUM + r"\s*Entertainment allowance",
+    "professional_tax": r"section\s+16\(iii\)\s+" + NUM,
+    "income_chargeable_under_head_salaries": NUM + r"\s*6\.",
+    "income_from_other_sources": r"Other Sources offered for TDS\s*\(a\)\s+" + NUM,
+    "income_from_house_property": r"house property reported by\s+employee offered for TDS\s+" + NUM,
+    "gross_total_income": NUM + r"\s*Gross total income",
+    "deduction_80C_80CCC_80CCD1": r"80CCD\(1\)\s*\(c\)\s*" + NUM,
+    "deductions_under_chapter_VI_A": NUM + r"\s*11\.",
+    "total_income": NUM + r"\s*Total taxable income",
+    "tax_on_total_income": r"^12\.\s*" + NUM,
+    "rebate_under_section_87A": r"87A, if applicable\s+" + NUM,
+    "surcharge": r"^15\.\s+" + NUM,
+    "health_and_education_cess": r"^16\.\s+" + NUM,
+}
+
+ASSESSMENT_YEAR = re.compile(r"assessment\s+year\s*:?\s*(\d{4})\s*-\s*\d{2,4}", re.IGNORECASE)
+
+COMPILED_RULES = {
+    name: re.compile(pattern, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+    for name, pattern in RULES.items()
+}
+
+TAX_BLOCK = re.compile(r"Total taxable income(.*?)(?:Verification|$)", re.IGNORECASE | re.DOTALL)
+NUMBER = re.compile(NUM)
+
+# Extractions scoring below this fall back to the model.
+CONFIDENCE_THRESHOLD = 1.0
+
+
+def _number(value):
+    value = float(value.replace(",", ""))
+    return int(value) if value.is_integer() else value
+
+
+def _close(a, b, tolerance=1):
+    return abs(a - b) <= tolerance
+
+
+def cess_rate(text):
+    """The cess rate for the certificate's financial year (its assessment year minus one).
+
+    Years without an entry in tax_rules.json use the latest year's rate.
+    """
+    match = ASSESSMENT_YEAR.search(text)
+    if match:
+        start = int(match.group(1)) - 1
+        financial_year = f"{start}-{(start + 1) % 100:02d}"
+        if financial_year in FINANCIAL_YEARS:
+            return rules_for(financial_year).cess_rate
+    return rules_for().cess_rate
+
+
+def parse_traces_form16(text):
+    """Extracts Form 16 fields with fixed rules.
+
+    Returns (data, confidence). data is None when a required row is missing;
+    confidence is the share of the form's own arithmetic checks that hold.
+    """
+    values = {}
+    for name, pattern in COMPILED_RULES.items():
+        match = pattern.search(text)
+        if match is None:
+            return None, 0.0
+        values[name] = _number(match.group(1))
+    v = values
+
+    deductions_16 = v["standard_deduction"] + v["entertainment_allowance"] + v["professional_tax"]
+    tax_payable = v["tax_on_total_income"] + v["surcharge"] + v["health_and_education_cess"] - v["rebate_under_section_87A"]
+
+    # Every amount in the tax computation rows must be accounted for; an
+    # unexplained one means relief under section 89 or a layout we misread.
+    tax_block = TAX_BLOCK.search(text)
+    known = {0, v["tax_on_total_income"], v["surcharge"], v["health_and_education_cess"],
+             v["rebate_under_section_87A"], tax_payable}
+    block_numbers = [_number(n) for n in NUMBER.findall(tax_block.group(1))] if tax_block else []
+
+    checks = [
+        _close(v["gross_salary"], v["salary_17_1"] + v["value_of_perquisites"] + v["profits_in_lieu_of_salary"]),
+        _close(v["salary_from_current_employer"], v["gross_salary"] - v["allowances_exempt_under_section_10"]),
+        _close(v["income_chargeable_under_head_salaries"], v["salary_from_current_employer"] - deductions_16),
+        _close(v["gross_total_income"], v["income_chargeable_under_head_salaries"]
+               + v["income_from_other_sources"] + v["income_from_house_property"]),
+        _close(v["total_income"], v["gross_total_income"] - v["deductions_under_chapter_VI_A"]),
+        # The 80C/80CCC/80CCD(1) total is the only Chapter VI-A row the rules
+        # read, so the aggregate must consist of it alone.
+        _close(v["deductions_under_chapter_VI_A"], v["deduction_80C_80CCC_80CCD1"]),
+        _close(v["health_and_education_cess"],
+               cess_rate(text) * (v["tax_on_total_income"] + v["surcharge"] - v["rebate_under_section_87A"]),
+               tolerance=2),
+        bool(block_numbers) and tax_payable in block_numbers and all(n in known for n in block_numbers),
+    ]
+    confidence = sum(checks) / len(checks)
+
+    house_property = v["income_from_house_property"]
+    data = dict.fromkeys(FORM16_FIELDS, 0)
+    data.update({
+        "salary_income": v["gross_salary"],
+        "rental_income": max(house_property, 0),
+        "home_loan_self": max(-house_property, 0),
+        "other_income": v["income_from_other_sources"],
+        "exempt_allowances": v["allowances_exempt_under_section_10"],
+        "deduction_80C": v["deduction_80C_80CCC_80CCD1"],
+        "deductions_under_section_16": deductions_16,
+        "net_tax_payable": tax_payable,
+    })
+    for name in FORM16_FIELDS:
+        if name in v:
+            data[name] = v[name]
+    return data, confidence
+
+
+def extract_with_rules(text):
+    """Returns the rule-based extraction if it is trustworthy, otherwise None."""
+    data, confidence = parse_traces_form16(text)
+    if data is None or confidence < CONFIDENCE_THRESHOLD:
+        return None
+    return data
@@ -0,0 +1,177 @@
+"""Server-side broker for model calls shared by every app session.
+
+All sessions borrow model clients from one pool, at most `max_concurrent`
+calls run at once, and waiting requests are served round-robin by user, so
+one user's burst of uploads cannot starve everyone else. Requests beyond the
+queue limits are refused with BrokerBusy instead of piling up until they time
+out.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from metrics import METRICS
+from rate_limit import RateLimiter
+
+
+class BrokerBusy(Exception):
+    """Raised when the broker cannot accept or schedule a request in time."""
+
+
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class LLMBroker:
+    """Shared client pool with a global concurrency limit and fair per-user queueing."""
+
+    def __init__(self, model_factory, max_concurrent=4, max_queued_per_user=4, max_queued=100,
+                 requests_per_minute=None, wait_timeout=120.0):
+        self.model_factory = model_factory
+        self.max_concurrent = max_concurrent
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued = max_queued
+        self.wait_timeout = wait_timeout
+        self._limiter = RateLimiter(requests_per_minute)
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # user -> deque of tickets; order is the round-robin turn
+        self._idle_clients = []
+        self._clients = 0
+        self._active = 0
+        self._queued = 0
+        self.served = 0
+        self.rejected = 0
+        self.longest_wait = 0.0
+
+    def _grant(self):
+        # Caller holds the lock. Hand free slots to the user at the head of the
+        # rotation, then send that user to the back.
+        while self._active < self.max_concurrent and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            queue.popleft().granted = True
+            self._queued -= 1
+            self._active += 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+        self._cond.notify_all()
+
+    def _ahead(self, user, ticket):
+        """Number of requests that will be served before `ticket` under round-robin."""
+        index = self._queues[user].index(ticket)
+        ahead = index
+        before = True
+        for other, queue in self._queues.items():
+            if other == user:
+                before = False
+            else:
+                ahead += min(len(queue), index + 1 if before else index)
+        return ahead
+
+    def _withdraw(self, user, ticket):
+        queue = self._queues.get(user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[user]
+
+    def _wait_for(self, user, ticket, on_wait):
+        deadline = time.monotonic() + self.wait_timeout
+        reported = None
+        with self._cond:
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._withdraw(user, ticket)
+                    self.rejected += 1
+                    METRICS.inc("broker_rejected_total", reason="timeout")
+                    raise BrokerBusy("The assistant is busy right now. Please try again in a minute.")
+                ahead = self._ahead(user, ticket)
+                if on_wait is not None and ahead != reported:
+                    reported = ahead
+                    self._cond.release()
+                    try:
+                        on_wait(ahead)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                self._cond.wait(min(remaining, 1.0))
+
+    def _checkout(self):
+        with self._cond:
+            if self._idle_clients:
+                return self._idle_clients.pop()
+            self._clients += 1
+        try:
+            return self.model_factory()
+        except BaseException:
+            with self._cond:
+                self._clients -= 1
+            raise
+
+    @contextmanager
+    def slot(self, user, on_wait=None):
+        """Waits for this user's turn and yields a pooled client for one call.
+
+        `on_wait(ahead)` is called whenever the number of requests ahead of
+        this one changes, so the caller can tell the user they are queued.
+        """
+        ticket = _Ticket()
+        with self._cond:
+            queue = self._queues.get(user)
+            if self._queued >= self.max_queued or (queue and len(queue) >= self.max_queued_per_user):
+                self.rejected += 1
+                METRICS.inc("broker_rejected_total", reason="queue_full")
+                raise BrokerBusy("Too many requests are waiting. Please try again in a minute.")
+            self._queues.setdefault(user, deque()).append(ticket)
+            self._queued += 1
+            self._grant()
+
+        started = time.monotonic()
+        client = None
+        try:
+            self._wait_for(user, ticket, on_wait)
+            waited = time.monotonic() - started
+            self.longest_wait = max(self.longest_wait, waited)
+            METRICS.observe("broker_wait", waited)
+            self._limiter.wait()
+            client = self._checkout()
+            yield client
+        finally:
+            with self._cond:
+                if ticket.granted:
+                    self._active -= 1
+                    self.served += 1
+                else:
+                    self._withdraw(user, ticket)
+                if client is not None:
+                    self._idle_clients.append(client)
+                self._grant()
+
+    def generate(self, user, prompt, on_wait=None, **options):
+        """Runs one non-streaming generate_content call for `user`."""
+        with self.slot(user, on_wait) as client:
+            return client.generate_content(prompt, **options)
+
+    def stream(self, user, prompt, on_wait=None):
+        """Yields streamed response chunks, holding the slot until the stream ends or is closed."""
+        with self.slot(user, on_wait) as client:
+            yield from client.generate_content(prompt, stream=True)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "users_waiting": len(self._queues),
+                "clients": self._clients,
+                "served": self.served,
+                "rejected": self.rejected,
+                "longest_wait_seconds": round(self.longest_wait, 3),
+            }
@@ -0,0 +1,157 @@
+"""Process-wide stage timers and counters.
+
+tax_pipeline.timed() records every pipeline stage here, and the app adds
+model call, token and cache counters. The registry can be exported as
+Prometheus text or JSON lines to a file, or pushed to a Prometheus
+Pushgateway URL, once or on a background interval.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "tax_assistant_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class _Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+class Metrics:
+    """Thread-safe counters and per-stage latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._stages = {}
+        self.started = time.time()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _Histogram()
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._stages.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """Returns {"stages": {stage: {...}}, "counters": {name{labels}: value}} as plain data."""
+        with self._lock:
+            stages = {
+                stage: {"count": h.count, "sum_seconds": round(h.total, 6), "max_seconds": round(h.max, 6),
+                        "mean_seconds": round(h.total / h.count, 6) if h.count else 0.0}
+                for stage, h in self._stages.items()
+            }
+            counters = {name + _format_labels(labels): value for (name, labels), value in self._counters.items()}
+        return {"stages": stages, "counters": counters}
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            if self._stages:
+                name = PREFIX + "stage_seconds"
+                lines.append(f"# HELP {name} Wall-clock time per pipeline stage.")
+                lines.append(f"# TYPE {name} histogram")
+                for stage, h in sorted(self._stages.items()):
+                    labels = (("stage", stage),)
+                    for bound, count in zip(BUCKETS, h.buckets):
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {h.total:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+
+            typed = set()
+            for (counter, labels), value in sorted(self._counters.items()):
+                name = PREFIX + counter
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, target):
+        """Writes the metrics to `target`.
+
+        An http(s) URL is treated as a Pushgateway job URL, a path ending in
+        .jsonl gets one JSON snapshot appended, and any other path is
+        replaced with Prometheus text.
+        """
+        if target.startswith(("http://", "https://")):
+            request = urllib.request.Request(target, data=self.prometheus_text().encode("utf-8"), method="PUT",
+                                             headers={"Content-Type": "text/plain; version=0.0.4"})
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+            return
+
+        directory = os.path.dirname(target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if target.endswith(".jsonl"):
+            with open(target, "a") as f:
+                f.write(json.dumps({"time": time.time(), "pid": os.getpid(), **self.snapshot()}) + "\n")
+        else:
+            temporary = f"{target}.{os.getpid()}.tmp"
+            with open(temporary, "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(temporary, target)
+
+    def start_exporter(self, target, interval_seconds=15.0):
+        """Exports to `target` every `interval_seconds` from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.export(target)
+                except OSError as e:
+                    logger.warning("Metrics export to %s failed: %s", target, e)
+
+        thread = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+        thread.start()
+        return thread
+
+
+METRICS = Metrics()
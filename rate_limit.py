@@ -0,0 +1,32 @@
+"""Rate limiting and retries for model calls, shared by the app's broker and the batch runner."""
+import random
+import threading
+import time
+
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `requests_per_minute` start per minute."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def call_with_retry(func, max_retries=3, base_delay=1.0):
+    """Calls func, retrying failures with exponential backoff and jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return func()
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(base_delay * 2 ** attempt + random.uniform(0, base_delay))
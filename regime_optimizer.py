@@ -0,0 +1,120 @@
+"""Search over deduction plans for the lowest tax, and regime breakeven points.
+
+Plans are evaluated in bulk with the NumPy slab tables in tax_engine, so a
+grid of thousands of allocations costs a few milliseconds. Taxable income is
+worked out the same way as compute_tax: the old regime subtracts the
+deductions, the new regime subtracts only the standard deduction.
+"""
+import time
+
+from form16_record import Form16Record
+from tax_engine import DEFAULT_FINANCIAL_YEAR, calculate_new_regime_tax, deduction_limits, old_regime_tax, rules_for
+from tax_pipeline import INCOME_FIELDS, claimed_deductions, compute_tax, field_value
+
+# Deductions a taxpayer can still choose to make, up to tax_engine's
+# deduction_limits. 80CCD(1B) is the extra NPS contribution claimed in the
+# deduction_80CCD field.
+OPTIMISED_SECTIONS = ("deduction_80C", "deduction_80CCD", "deduction_80D", "deduction_80TTA")
+SECTION_LABELS = {
+    "deduction_80C": "80C",
+    "deduction_80CCD": "80CCD(1B)",
+    "deduction_80D": "80D",
+    "deduction_80TTA": "80TTA / 80TTB",
+}
+
+
+def breakeven_deductions(total_income, age_group, step=1000, financial_year=DEFAULT_FINANCIAL_YEAR):
+    """Smallest total deduction at which the old regime costs no more than the new one.
+
+    Returns None if no deduction up to the whole income gets there.
+    """
+    import numpy as np
+
+    rules = rules_for(financial_year)
+    new_tax = calculate_new_regime_tax(max(0, total_income - rules.standard_deduction), financial_year)
+    coarse = np.arange(0, total_income + step, step, dtype=np.float64)
+    old = old_regime_tax(np.maximum(total_income - coarse, 0), age_group, financial_year)
+    hits = np.flatnonzero(old <= new_tax)
+    if not hits.size:
+        return None
+    if hits[0] == 0:
+        return 0
+    low = int(coarse[hits[0] - 1])
+    fine = np.arange(low, int(coarse[hits[0]]) + 1, dtype=np.float64)
+    old = old_regime_tax(np.maximum(total_income - fine, 0), age_group, financial_year)
+    return int(fine[np.flatnonzero(old <= new_tax)[0]])
+
+
+def optimise_regime(data, age_group="Below 60", budget=None, parents_senior=False, steps=11,
+                    financial_year=DEFAULT_FINANCIAL_YEAR):
+    """Finds the deduction plan with the lowest tax across both regimes.
+
+    Each section in OPTIMISED_SECTIONS is tried at `steps` evenly spaced
+    amounts between what is already claimed and its limit. Claims count as
+    in compute_tax (tax_pipeline.claimed_deductions), whose tax is the
+    current position savings are measured against, so no plan claims less
+    than now. New
+    investment (everything except savings interest) must fit within `budget`
+    when one is given. Among plans with the same tax, the one needing the
+    least new investment wins. The lowest-tax old regime plan is reported as
+    well, since with the new regime ahead the overall best is usually to
+    invest nothing more.
+
+    breakeven_deductions gives each regime's side of the breakeven: the
+    smallest total deduction at which the Old Regime costs no more than the
+    New, and the largest at which the New Regime is still cheaper. Either is
+    None when that regime never comes out ahead.
+    """
+    import numpy as np
+
+    started = time.perf_counter()
+    data = Form16Record.from_dict(data)
+    total_income = sum(field_value(data, name) for name in INCOME_FIELDS)
+    rules = rules_for(financial_year)
+    # The current position is what compute_tax counts, so savings are measured
+    # against the tax the calculator shows.
+    current = claimed_deductions(data, age_group, financial_year, parents_senior)
+    baseline = compute_tax(data, age_group, financial_year, parents_senior=parents_senior)
+    limits = deduction_limits(age_group, field_value(data, "interest_income"), parents_senior, financial_year)
+    fixed = sum(amount for name, amount in current.items() if name not in OPTIMISED_SECTIONS)
+
+    axes = [np.unique(np.linspace(current[name], limits[name], steps).round()) for name in OPTIMISED_SECTIONS]
+    grid = [axis.ravel() for axis in np.meshgrid(*axes, indexing="ij")]
+    claimed = fixed + sum(grid)
+    outlay = sum(np.maximum(amounts - current[name], 0)
+                 for name, amounts in zip(OPTIMISED_SECTIONS, grid) if name != "deduction_80TTA")
+
+    old = old_regime_tax(np.maximum(total_income - claimed, 0), age_group, financial_year)
+    new_tax = calculate_new_regime_tax(max(0, total_income - rules.standard_deduction), financial_year)
+    feasible = np.ones(old.shape, dtype=bool) if budget is None else outlay <= budget
+    best_tax = np.where(feasible, np.minimum(old, new_tax), np.iinfo(np.int64).max)
+    best = np.lexsort((outlay, best_tax))[0]
+    best_old = np.lexsort((outlay, np.where(feasible, old, np.iinfo(np.int64).max)))[0]
+
+    current_total = fixed + sum(current[name] for name in OPTIMISED_SECTIONS)
+    plan = {name: int(amounts[best]) for name, amounts in zip(OPTIMISED_SECTIONS, grid)}
+    tax_old = int(old[best])
+    breakeven = breakeven_deductions(total_income, age_group, financial_year=financial_year)
+    if breakeven is None:
+        new_breakeven = total_income
+    else:
+        new_breakeven = breakeven - 1 if breakeven > 0 else None
+    return {
+        "plan": plan,
+        "current": {name: int(current[name]) for name in OPTIMISED_SECTIONS},
+        "extra_investment": int(outlay[best]),
+        "total_deductions": int(claimed[best]),
+        "tax_old": tax_old,
+        "tax_new": new_tax,
+        "recommended_regime": "New Regime" if new_tax < tax_old else "Old Regime",
+        "tax": min(tax_old, new_tax),
+        "saving_vs_current": min(baseline["tax_old"], baseline["tax_new"]) - min(tax_old, new_tax),
+        "breakeven_deductions": {"Old Regime": breakeven, "New Regime": new_breakeven},
+        "additional_deductions_to_breakeven": None if breakeven is None else max(0, breakeven - current_total),
+        "max_deductions": fixed + sum(limits.values()),
+        "old_regime_plan": {name: int(amounts[best_old]) for name, amounts in zip(OPTIMISED_SECTIONS, grid)},
+        "old_regime_tax": int(old[best_old]),
+        "old_regime_extra_investment": int(outlay[best_old]),
+        "plans_evaluated": int(old.size),
+        "seconds": time.perf_counter() - started,
+    }
@@ -0,0 +1,142 @@
+"""Offline model backend that replays recorded responses.
+
+ReplayModel has the same generate_content(prompt, stream=False,
+generation_config=None) surface as the Gemini model, so the app, CLI, batch
+runner and benchmarks can run without network access. Latency and failures are injected to match
+production behaviour. RecordingModel wraps a live model and saves its
+responses in the format ReplayModel reads.
+
+A recording file is JSON:
+
+    {"responses": {"<sha256 of prompt>": "response text", ...},
+     "rules": [{"contains": "Form 16", "response": "..."}, ...],
+     "default": "response text"}
+
+A prompt is answered from its exact recording, then from the first rule
+whose "contains" text appears in it, then from "default".
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+
+class InjectedFailure(Exception):
+    """Raised by ReplayModel to simulate a failed model call."""
+
+
+class ReplayResponse:
+    """Minimal stand-in for a Gemini response or stream chunk."""
+
+    __slots__ = ("text", "parts")
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text] if text else []
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def load_recording(path):
+    with open(path, encoding="utf-8") as f:
+        recording = json.load(f)
+    recording.setdefault("responses", {})
+    recording.setdefault("rules", [])
+    recording.setdefault("default", "")
+    return recording
+
+
+class ReplayModel:
+    """Answers prompts from a recording with configurable latency and failure rate.
+
+    `latency` is the delay before the response (or first chunk) and
+    `jitter` adds up to that many seconds at random. Streams are split into
+    `chunk_chars`-sized chunks `chunk_latency` seconds apart.
+    """
+
+    def __init__(self, recording=None, latency=0.0, jitter=0.0, chunk_latency=0.0, chunk_chars=40,
+                 failure_rate=0.0, seed=None):
+        self.recording = recording or {"responses": {}, "rules": [], "default": ""}
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_latency = chunk_latency
+        self.chunk_chars = chunk_chars
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    @classmethod
+    def from_file(cls, path, **options):
+        return cls(load_recording(path), **options)
+
+    @classmethod
+    def from_env(cls):
+        """Builds the model from the TAX_ASSISTANT_REPLAY_* environment variables."""
+        path = os.environ.get("TAX_ASSISTANT_REPLAY_FILE",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "replay_responses.json"))
+        return cls.from_file(
+            path,
+            latency=float(os.environ.get("TAX_ASSISTANT_REPLAY_LATENCY", "0")),
+            jitter=float(os.environ.get("TAX_ASSISTANT_REPLAY_JITTER", "0")),
+            chunk_latency=float(os.environ.get("TAX_ASSISTANT_REPLAY_CHUNK_LATENCY", "0")),
+            failure_rate=float(os.environ.get("TAX_ASSISTANT_REPLAY_FAILURE_RATE", "0")),
+        )
+
+    def response_text(self, prompt):
+        recorded = self.recording["responses"].get(prompt_key(prompt))
+        if recorded is not None:
+            return recorded
+        for rule in self.recording["rules"]:
+            if rule["contains"] in prompt:
+                return rule["response"]
+        return self.recording["default"]
+
+    def _delay_and_maybe_fail(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise InjectedFailure("Injected model failure")
+
+    def _stream(self, text):
+        for start in range(0, len(text), self.chunk_chars):
+            if start and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield ReplayResponse(text[start:start + self.chunk_chars])
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        self._delay_and_maybe_fail()
+        text = self.response_text(prompt)
+        if stream:
+            return self._stream(text)
+        return ReplayResponse(text)
+
+
+class RecordingModel:
+    """Wraps a live model and records every non-streaming response for replay."""
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+        self.recording = load_recording(path) if os.path.exists(path) else {"responses": {}, "rules": [], "default": ""}
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        response = self.model.generate_content(prompt, stream=stream, generation_config=generation_config)
+        if not stream:
+            with self._lock:
+                self.recording["responses"][prompt_key(prompt)] = response.text if response else ""
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(self.recording, f, indent=2, ensure_ascii=False)
+        return response
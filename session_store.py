@@ -0,0 +1,178 @@
+"""Persistent snapshots of app sessions, so a refresh or restart does not lose work.
+
+Each session saves its extracted Form 16 data, calculation results and chat
+history as separate compact snapshots: the Form16Record's own binary layout
+for the extracted data, zlib-compressed compact JSON for the rest. Only the
+snapshot that changed is rewritten. On resume every snapshot is read once,
+on the session's first run, and kept in session state after that. Sessions
+are indexed by signed-in user, so a returning user's latest session can be
+found without re-extracting.
+
+Stores are pluggable through SESSION_STORES; SQLite is the default.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from form16 import dump_json_bytes
+from form16_record import Form16Record
+
+SNAPSHOT_NAMES = ("extracted_tax_data", "calculation_results", "messages")
+
+
+def encode_snapshot(name, value):
+    if name == "extracted_tax_data":
+        return Form16Record.from_dict(value).to_bytes()
+    return zlib.compress(dump_json_bytes(value, compact=True))
+
+
+def decode_snapshot(name, blob):
+    if name == "extracted_tax_data":
+        return Form16Record.from_bytes(blob)
+    return json.loads(zlib.decompress(blob))
+
+
+class SnapshotTracker:
+    """Remembers the values last saved, so only changed snapshots are written.
+
+    Records and calculation results are replaced rather than mutated, and
+    chat messages are only ever appended, so identity checks are enough and
+    nothing has to be encoded just to find out whether it changed.
+    """
+
+    def __init__(self):
+        self._saved = {}
+
+    @staticmethod
+    def _marker(value):
+        if isinstance(value, list):
+            return len(value), (value[-1] if value else None)
+        return None, value
+
+    def mark(self, name, value):
+        self._saved[name] = self._marker(value)
+
+    def changed(self, name, value):
+        if name not in self._saved:
+            return value is not None and value != []
+        size, last = self._marker(value)
+        saved_size, saved_last = self._saved[name]
+        return size != saved_size or last is not saved_last
+
+
+class SQLiteSessionStore:
+    """Session snapshots in SQLite, one row per session and snapshot name."""
+
+    def __init__(self, path, max_age_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    user TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    session_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, name)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user, updated_at)")
+            expired = time.time() - max_age_seconds
+            conn.execute(
+                "DELETE FROM snapshots WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)",
+                (expired,),
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (expired,))
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, session_id, name, value, user=None):
+        """Writes one snapshot; None deletes it. The session's user is recorded too."""
+        now = time.time()
+        blob = None if value is None else encode_snapshot(name, value)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO sessions (session_id, user, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    user = COALESCE(excluded.user, user),
+                    updated_at = excluded.updated_at
+                """,
+                (session_id, user, now),
+            )
+            if blob is None:
+                conn.execute("DELETE FROM snapshots WHERE session_id = ? AND name = ?", (session_id, name))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", (session_id, name, blob, now)
+                )
+
+    def load(self, session_id, name):
+        """Returns the decoded snapshot, or None if the session has none under that name."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM snapshots WHERE session_id = ? AND name = ?", (session_id, name)
+            ).fetchone()
+        return None if row is None else decode_snapshot(name, row[0])
+
+    def session_info(self, session_id):
+        """Returns {"user", "updated_at"} for a stored session, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT user, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return None if row is None else {"user": row[0], "updated_at": row[1]}
+
+    def latest_session(self, user):
+        """Returns the most recently updated session id for a user, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT session_id FROM sessions WHERE user = ? ORDER BY updated_at DESC LIMIT 1", (user,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM snapshots WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+SESSION_STORES = {"sqlite": SQLiteSessionStore}
+
+
+def create_session_store(backend, path):
+    """Builds the session store named `backend`, or returns None when it is "off" or empty."""
+    if not backend or backend == "off":
+        return None
+    try:
+        store_class = SESSION_STORES[backend]
+    except KeyError:
+        raise ValueError(f"Unknown session store {backend!r}; choose from {', '.join(sorted(SESSION_STORES))}") from None
+    return store_class(path)
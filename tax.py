@@ -1,174 +1,194 @@
 import streamlit as st
-import google.generativeai as genai
-import pypdf
-import json
 import os
-import requests
-import re
-
-try:
-    API_KEY = ""  # Replace with your actual API key!
-    genai.configure(api_key=API_KEY)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-except ImportError:
-    st.error("Error: google-generativeai library not found. Please install it using 'pip install google-generativeai'")
-    st.stop()
-except Exception as e:
-    st.error(f"Error initializing Gemini model: {e}")
-    st.stop()
+import time
+import uuid
+import zlib
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from answer_cache import AnswerCache
+from conversation import ConversationMemory, is_follow_up
+from extraction_cache import ExtractionCache
+from llm_broker import BrokerBusy, LLMBroker
+from metrics import METRICS
+from form16 import MODEL_NAME, PdfReadError, build_itr1_json, dump_json_bytes, estimate_tokens
+from regime_optimizer import SECTION_LABELS, optimise_regime
+from session_store import SNAPSHOT_NAMES, SnapshotTracker, create_session_store
+from tax_engine import AGE_GROUPS, FINANCIAL_YEARS, rules_for
+from tax_pipeline import (DerivedValues, ExtractionError, compute_tax, create_model, extract_form16, form_values,
+                          timed)
+
+DATA_DIR = os.environ.get("TAX_ASSISTANT_DATA_DIR", ".tax_assistant")
+API_KEY = ""  # Replace with your actual API key!
+
+ADMIN_PANEL = os.environ.get("TAX_ASSISTANT_ADMIN") == "1"
+METRICS_EXPORT = os.environ.get("TAX_ASSISTANT_METRICS_EXPORT", "")
+METRICS_EXPORT_INTERVAL = float(os.environ.get("TAX_ASSISTANT_METRICS_INTERVAL", "15"))
+LLM_CONCURRENCY = int(os.environ.get("TAX_ASSISTANT_LLM_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("TAX_ASSISTANT_LLM_RPM", "0")) or None
+SESSION_STORE = os.environ.get("TAX_ASSISTANT_SESSION_STORE", "sqlite")
+
+def build_model():
+    """Builds a Gemini client; called by the broker when its pool needs another one."""
+    try:
+        return create_model(API_KEY)
+    except ImportError:
+        raise RuntimeError("google-generativeai library not found. Please install it using 'pip install google-generativeai'")
+
+@st.cache_resource
+def get_broker():
+    """Returns the process-wide broker that every session's model calls go through."""
+    return LLMBroker(build_model, max_concurrent=LLM_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE)
+
+@st.cache_resource
+def start_metrics_exporter():
+    """Starts the periodic metrics export once per process, if a target is configured."""
+    if METRICS_EXPORT:
+        return METRICS.start_exporter(METRICS_EXPORT, METRICS_EXPORT_INTERVAL)
+    return None
+
+@st.cache_resource
+def get_session_store():
+    """Returns the process-wide session store, or None if persistence is turned off."""
+    return create_session_store(SESSION_STORE, os.path.join(DATA_DIR, "sessions.sqlite3"))
+
+def current_user():
+    """The signed-in user's email when the app has authentication configured, otherwise None."""
+    try:
+        return st.user.get("email") if st.user.get("is_logged_in") else None
+    except Exception:
+        return None
+
+def resume_session_id():
+    """Finds a stored session to resume: the one in the URL, else the signed-in user's latest."""
+    store = get_session_store()
+    if store is None:
+        return None
+    user = current_user()
+    session_id = st.query_params.get("session")
+    if session_id:
+        info = store.session_info(session_id)
+        if info is not None and info["user"] in (None, user):
+            return session_id
+    return store.latest_session(user) if user else None
+
+def restore_snapshot(name, default=None):
+    """Reads one snapshot of a resumed session; called once per snapshot, on the session's first run."""
+    value = None
+    if st.session_state.resumed:
+        store = get_session_store()
+        with timed(None, "session_restore"):
+            try:
+                value = store.load(st.session_state.session_id, name)
+            except (ValueError, zlib.error) as e:
+                # A corrupt or outdated snapshot; start that part afresh and drop it.
+                METRICS.inc("session_restore_errors_total", snapshot=name)
+                st.warning(f"Could not restore the saved {name.replace('_', ' ')}: {e}")
+                store.save(st.session_state.session_id, name, None)
+    if value is None:
+        value = default
+    st.session_state.snapshots.mark(name, value)
+    return value
+
+def save_session():
+    """Writes the snapshots that changed during this run."""
+    store = get_session_store()
+    if store is None:
+        return
+    tracker = st.session_state.snapshots
+    for name in SNAPSHOT_NAMES:
+        value = st.session_state.get(name)
+        if tracker.changed(name, value):
+            with timed(None, "session_save"):
+                store.save(st.session_state.session_id, name, value, user=current_user())
+            tracker.mark(name, value)
+
+def show_session_controls():
+    if st.session_state.resumed and st.session_state.extracted_tax_data is not None:
+        with st.sidebar:
+            st.caption("♻️ Restored your previous session")
+            if st.button("Start a new session", key="new_session"):
+                get_session_store().delete(st.session_state.session_id)
+                st.session_state.clear()
+                st.query_params.clear()
+                st.rerun()
 
+def show_queue_position(notice, ahead):
+    if ahead:
+        notice.info(f"⏳ The assistant is busy - {ahead} request(s) ahead of yours. Your request is queued.")
+    else:
+        notice.info("⏳ Your request is next...")
+
+def ignore_queue_position(ahead):
+    pass
+
+if "session_id" not in st.session_state:
+    resumed = resume_session_id()
+    st.session_state.session_id = resumed or uuid.uuid4().hex
+    st.session_state.resumed = resumed is not None
+    st.session_state.snapshots = SnapshotTracker()
+    if get_session_store() is not None:
+        # Keeps the session in the URL, so a refresh comes back to it.
+        st.query_params["session"] = st.session_state.session_id
 if 'extracted_tax_data' not in st.session_state:
-    st.session_state.extracted_tax_data = None
-if 'json_file_path' not in st.session_state:
-    st.session_state.json_file_path = None
-if 'tax_calculated' not in st.session_state:
-    st.session_state.tax_calculated = False
+    st.session_state.extracted_tax_data = restore_snapshot("extracted_tax_data")
 if 'calculation_results' not in st.session_state:
-    st.session_state.calculation_results = None
+    st.session_state.calculation_results = restore_snapshot("calculation_results")
+if 'tax_calculated' not in st.session_state:
+    st.session_state.tax_calculated = st.session_state.calculation_results is not None
+if 'itr1_json' not in st.session_state:
+    restored = st.session_state.extracted_tax_data
+    st.session_state.itr1_json = (None if restored is None
+                                  else build_itr1_json(restored, st.session_state.calculation_results))
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = restore_snapshot("messages", [])
 if "edited_data" not in st.session_state:
     st.session_state.edited_data = False
-
-SYSTEM_PROMPT = """
-You are an expert in Indian taxation. Extract tax details from Form 16 PDFs.
-Your task is to extract the following information and return it in a strict JSON format:
-{
-  {
-  "salary_income": "numeric value",
-  "interest_income": "numeric value",
-  "rental_income": "numeric value",
-  "digital_assets_income": "numeric value",
-  "exempt_allowances": "numeric value",
-  "home_loan_self": "numeric value",
-  "home_loan_letout": "numeric value",
-  "other_income": "numeric value",
-  "deduction_80C": "numeric value",
-  "deduction_80CCC": "numeric value",
-  "deduction_80CCD1": "numeric value",
-  "deduction_80CCD1B": "numeric value",
-  "deduction_80CCD2": "numeric value",
-  "deduction_80D": "numeric value",
-  "deduction_80DD": "numeric value",
-  "deduction_80DDB": "numeric value",
-  "deduction_80E": "numeric value",
-  "deduction_80EE": "numeric value",
-  "deduction_80EEA": "numeric value",
-  "deduction_80G": "numeric value",
-  "deduction_80GG": "numeric value",
-  "deduction_80GGA": "numeric value",
-  "deduction_80GGC": "numeric value",
-  "deduction_80TTA": "numeric value",
-  "deduction_80TTB": "numeric value",
-  "deduction_80U": "numeric value",
-  "other_deductions": "numeric value",
-  "gross_salary": "numeric value",
-  "value_of_perquisites": "numeric value",
-  "profits_in_lieu_of_salary": "numeric value",
-  "allowances_exempt_under_section_10": "numeric value",
-  "deductions_under_section_16": "numeric value",
-  "income_chargeable_under_head_salaries": "numeric value",
-  "income_from_house_property": "numeric value",
-  "income_from_other_sources": "numeric value",
-  "gross_total_income": "numeric value",
-  "deductions_under_chapter_VI_A": "numeric value",
-  "total_income": "numeric value",
-  "tax_on_total_income": "numeric value",
-  "rebate_under_section_87A": "numeric value",
-  "surcharge": "numeric value",
-  "health_and_education_cess": "numeric value",
-  "relief_under_section_89": "numeric value",
-  "net_tax_payable": "numeric value"
-}
-
-}
-Replace 'numeric value' with the actual numbers found in the document. Use 0 for any fields not found.
-Only return the JSON - no explanation or other text.
-"""
-
-def extract_text_from_pdf(uploaded_file):
-    """Extracts text from a PDF file."""
-    try:
-        reader = pypdf.PdfReader(uploaded_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except pypdf.errors.PdfReadError as e:
-        st.error(f"Error reading the PDF: {e}")
-        return None
-    except Exception as e:
-        st.error(f"An unexpected error occurred: {e}")
-        return None
-
-
-def extract_json_from_text(text):
-    try:
-        text = re.sub(r'\njson', '', text)
-        text = re.sub(r'\n', '', text)
-        json_pattern = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_pattern:
-            json_text = json_pattern.group(0)
-            return json.loads(json_text)
-        return json.loads(text.strip())
-    except (json.JSONDecodeError, AttributeError):
-        st.error(f"Error parsing JSON: {e}")
-        return None
-    except Exception as e:
-        st.error(f"An unexpected error occurred: {e}")
-        return None
-
+if "derived" not in st.session_state:
+    st.session_state.derived = DerivedValues()
+if "tab_timings" not in st.session_state:
+    st.session_state.tab_timings = {}
+
+class SessionModel:
+    """Stands in for the Gemini model, routing this session's calls through the shared broker."""
+
+    def __init__(self):
+        self.user = st.session_state.session_id
+
+    def generate_content(self, prompt, stream=False, on_wait=None, **options):
+        notice = None
+        if on_wait is None:
+            if get_script_run_ctx(suppress_warning=True) is None:
+                # Chunked extraction calls in from worker threads, which cannot
+                # draw; the script thread's spinner covers them.
+                on_wait = ignore_queue_position
+            else:
+                notice = st.empty()
+                on_wait = lambda ahead: show_queue_position(notice, ahead)
+        broker = get_broker()
+        if stream:
+            return broker.stream(self.user, prompt, on_wait)
+        try:
+            return broker.generate(self.user, prompt, on_wait, **options)
+        finally:
+            if notice is not None:
+                notice.empty()
+
+model = SessionModel()
+
+@st.cache_resource
+def get_extraction_cache():
+    """Returns the process-wide Form 16 extraction cache."""
+    return ExtractionCache(os.path.join(DATA_DIR, "extraction_cache.sqlite3"))
+
+@st.cache_resource
+def get_answer_cache():
+    """Returns the process-wide Tax Advisor answer cache."""
+    return AnswerCache(os.path.join(DATA_DIR, "answer_cache.sqlite3"), namespace=MODEL_NAME)
 
 def generate_itr1_json(extracted_data, calculation_results=None):
-    """Generates an ITR-1 JSON file."""
+    """Generates the ITR-1 JSON document for this session."""
     try:
-        itr1_json = {
-            "ITR1_FORM_DATA": {
-                "Part_A_General_1": {
-                    "AssesseeVerPAN": extracted_data.get("PAN", ""),
-                    "FirstName": extracted_data.get("Name", ""),
-                    "Address": extracted_data.get("Address", ""),
-                    "MobileNo": extracted_data.get("Contact", "")
-                },
-                "Part_B_TI": {
-                    "IncSalary": int(float(extracted_data.get("salary_income", 0))),
-                    "IncInterest": int(float(extracted_data.get("interest_income", 0))),
-                    "IncHouseProp": int(float(extracted_data.get("rental_income", 0))),
-                    "IncOther": int(float(extracted_data.get("other_income", 0))),
-                    "DigitalAssets": int(float(extracted_data.get("digital_assets_income", 0)))
-                },
-                "Part_C_Deductions": {
-                    "Section80C": int(float(extracted_data.get("deduction_80C", 0))),
-                    "Section80D": int(float(extracted_data.get("deduction_80D", 0))),
-                    "Section80EEA": int(float(extracted_data.get("deduction_80EEA", 0))),
-                    "Section80CCD2": int(float(extracted_data.get("deduction_80CCD2", 0))),
-                    "Section80TTA": int(float(extracted_data.get("deduction_80TTA", 0))),
-                    "Section80G": int(float(extracted_data.get("deduction_80G", 0))),
-                    "Section80CCD": int(float(extracted_data.get("deduction_80CCD", 0))),
-                    "OtherDeductions": int(float(extracted_data.get("other_deductions", 0)))
-                },
-                "ExemptAllowances": int(float(extracted_data.get("exempt_allowances", 0))),
-                "HomeLoanInterestSelfOccupied": int(float(extracted_data.get("home_loan_self", 0))),
-                "HomeLoanInterestLetOut": int(float(extracted_data.get("home_loan_letout", 0)))
-            }
-        }
-
-        if calculation_results:
-            itr1_json["Tax_Calculation"] = {
-                "TotalIncome": calculation_results["total_income"],
-                "TotalDeductions": calculation_results["total_deductions"],
-                "TaxableIncomeOldRegime": calculation_results["taxable_income_old"],
-                "TaxableIncomeNewRegime": calculation_results["taxable_income_new"],
-                "TaxPayableOldRegime": calculation_results["tax_old"],
-                "TaxPayableNewRegime": calculation_results["tax_new"],
-                "RecommendedRegime": calculation_results["recommended_regime"]
-            }
-
-        json_filename = "itr1_prefilled.json"
-        with open(json_filename, "w") as json_file:
-            json.dump(itr1_json, json_file, indent=4)
-
-        return json_filename
+        with timed(None, "itr1_json"):
+            return build_itr1_json(extracted_data, calculation_results)
     except (TypeError, ValueError, KeyError) as e:
         st.error(f"Error generating ITR-1 JSON: {e}")
         return None
@@ -181,6 +201,8 @@ def edit_extracted_data():
     
     if st.session_state.extracted_tax_data is not None:
         data = st.session_state.extracted_tax_data
+        prefill = st.session_state.derived.get("edit_prefill", (data, None), form_values)
+        caps = rules_for().deduction_caps
         edited_data = {}
         col1, col2 = st.columns(2)
         
@@ -189,56 +211,56 @@ def edit_extracted_data():
             edited_data["salary_income"] = st.number_input(
                 "Income from Salary (₹)", 
                 min_value=0, 
-                value=int(float(data.get("salary_income", 0))),
+                value=prefill["salary_income"],
                 key="edit_salary_income"
             )
             
             edited_data["interest_income"] = st.number_input(
                 "Income from Interest (₹)", 
                 min_value=0, 
-                value=int(float(data.get("interest_income", 0))),
+                value=prefill["interest_income"],
                 key="edit_interest_income"
             )
             
             edited_data["rental_income"] = st.number_input(
                 "Rental Income (₹)", 
                 min_value=0, 
-                value=int(float(data.get("rental_income", 0))),
+                value=prefill["rental_income"],
                 key="edit_rental_income"
             )
             
             edited_data["digital_assets_income"] = st.number_input(
                 "Income from Digital Assets (₹)", 
                 min_value=0, 
-                value=int(float(data.get("digital_assets_income", 0))),
+                value=prefill["digital_assets_income"],
                 key="edit_digital_assets_income"
             )
             
             edited_data["exempt_allowances"] = st.number_input(
                 "Exempt Allowances (₹)", 
                 min_value=0, 
-                value=int(float(data.get("exempt_allowances", 0))),
+                value=prefill["exempt_allowances"],
                 key="edit_exempt_allowances"
             )
             
             edited_data["home_loan_self"] = st.number_input(
                 "Interest on Home Loan - Self Occupied (₹)", 
                 min_value=0, 
-                value=int(float(data.get("home_loan_self", 0))),
+                value=prefill["home_loan_self"],
                 key="edit_home_loan_self"
             )
             
             edited_data["home_loan_letout"] = st.number_input(
                 "Interest on Home Loan - Let Out (₹)", 
                 min_value=0, 
-                value=int(float(data.get("home_loan_letout", 0))),
+                value=prefill["home_loan_letout"],
                 key="edit_home_loan_letout"
             )
             
             edited_data["other_income"] = st.number_input(
                 "Other Income (₹)", 
                 min_value=0, 
-                value=int(float(data.get("other_income", 0))),
+                value=prefill["other_income"],
                 key="edit_other_income"
             )
         
@@ -246,57 +268,57 @@ def edit_extracted_data():
             st.write("Deduction Details")
             edited_data["deduction_80C"] = st.number_input(
                 "Basic Deductions - 80C (₹)", 
-                min_value=0, max_value=150000, 
-                value=min(int(float(data.get("deduction_80C", 0))), 150000),
+                min_value=0, max_value=caps["deduction_80C"], 
+                value=prefill["deduction_80C"],
                 key="edit_deduction_80C"
             )
             
             edited_data["deduction_80D"] = st.number_input(
                 "Medical Insurance - 80D (₹)", 
                 min_value=0, 
-                value=int(float(data.get("deduction_80D", 0))),
+                value=prefill["deduction_80D"],
                 key="edit_deduction_80D"
             )
             
             edited_data["deduction_80EEA"] = st.number_input(
                 "Interest on Housing Loan - 80EEA (₹)", 
                 min_value=0, 
-                value=int(float(data.get("deduction_80EEA", 0))),
+                value=prefill["deduction_80EEA"],
                 key="edit_deduction_80EEA"
             )
             
             edited_data["deduction_80CCD2"] = st.number_input(
                 "Employer's NPS - 80CCD(2) (₹)", 
                 min_value=0, 
-                value=int(float(data.get("deduction_80CCD2", 0))),
+                value=prefill["deduction_80CCD2"],
                 key="edit_deduction_80CCD2"
             )
             
             edited_data["deduction_80TTA"] = st.number_input(
                 "Interest from Deposits - 80TTA (₹)", 
-                min_value=0, max_value=10000, 
-                value=min(int(float(data.get("deduction_80TTA", 0))), 10000),
+                min_value=0, max_value=caps["deduction_80TTA"], 
+                value=prefill["deduction_80TTA"],
                 key="edit_deduction_80TTA"
             )
             
             edited_data["deduction_80G"] = st.number_input(
                 "Donations to Charity - 80G (₹)", 
                 min_value=0, 
-                value=int(float(data.get("deduction_80G", 0))),
+                value=prefill["deduction_80G"],
                 key="edit_deduction_80G"
             )
             
             edited_data["deduction_80CCD"] = st.number_input(
                 "Employee's NPS - 80CCD (₹)", 
                 min_value=0, 
-                value=int(float(data.get("deduction_80CCD", 0))),
+                value=prefill["deduction_80CCD"],
                 key="edit_deduction_80CCD"
             )
             
             edited_data["other_deductions"] = st.number_input(
                 "Other Deductions (₹)", 
                 min_value=0, 
-                value=int(float(data.get("other_deductions", 0))),
+                value=prefill["other_deductions"],
                 key="edit_other_deductions"
             )
         
@@ -334,10 +356,9 @@ def edit_extracted_data():
         
         with col1:
             if st.button("Save Changes", key="save_edited_data"):
-                st.session_state.extracted_tax_data = edited_data
+                st.session_state.extracted_tax_data = data.replace(edited_data)
 
-                json_file_path = generate_itr1_json(edited_data)
-                st.session_state.json_file_path = json_file_path
+                st.session_state.itr1_json = generate_itr1_json(st.session_state.extracted_tax_data)
                 
                 st.session_state.edited_data = False
                 
@@ -367,52 +388,75 @@ def form16_extraction():
         
         if process_button:
             with st.spinner("Processing Form 16... This may take a moment"):
-                extracted_text = extract_text_from_pdf(uploaded_file)
-                
                 try:
-                    response = model.generate_content(SYSTEM_PROMPT + "\n\n" + extracted_text)
-                    response_text = response.text if response else ""
+                    extracted_data, info = extract_form16(uploaded_file.getvalue(), model, get_extraction_cache())
+                except PdfReadError as e:
+                    st.error(f"Error reading the PDF: {e}")
+                except ExtractionError as e:
+                    st.error("Could not extract structured data. Please check the PDF format or try another file.")
+                    st.code(e.response_text or str(e))
+
+                    st.info("👉 Go to the 'Income Tax Calculator' tab to calculate your tax and then download your ITR-1 JSON file from the 'Download ITR-1 JSON' tab.")
+                except BrokerBusy as e:
+                    st.warning(f"⏳ {e}")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+                else:
+                    ocr_stats = info.get("ocr_stats")
+                    if ocr_stats and ocr_stats["ocr_pages"] + ocr_stats["cached_pages"]:
+                        st.caption(f"🔍 Read {ocr_stats['ocr_pages'] + ocr_stats['cached_pages']} scanned page(s) with OCR")
+                    if info["source"] == "cache":
+                        st.caption("⚡ Loaded from extraction cache")
+                    elif info["source"] == "rules":
+                        st.caption("⚡ Standard TRACES layout recognised - extracted without the AI model")
+                    else:
+                        prompt_stats = info["prompt_stats"]
+                        st.caption(
+                            f"Prompt size: ~{prompt_stats['tokens_before']:,} → ~{prompt_stats['tokens_after']:,} tokens "
+                            f"({prompt_stats['pages_kept']} of {prompt_stats['pages']} pages sent)"
+                        )
+                        chunk_stats = info.get("chunk_stats")
+                        if chunk_stats:
+                            st.caption(
+                                f"Long document: extracted in {chunk_stats['chunks']} parallel chunks"
+                                + (f", {chunk_stats['failed_chunks']} unreadable" if chunk_stats["failed_chunks"] else "")
+                            )
+                            if chunk_stats["conflicts"]:
+                                st.warning(
+                                    "Chunks disagreed on " + ", ".join(chunk_stats["conflicts"])
+                                    + ". Part B totals were preferred; please review these values."
+                                )
+
+                    st.session_state.extracted_tax_data = extracted_data
+                    st.session_state.edited_data = False
+
+                    st.session_state.itr1_json = generate_itr1_json(extracted_data)
+
+                    st.session_state.tax_calculated = False
                     
-                    extracted_data = extract_json_from_text(response_text)
+                    st.success("✅ Data extracted successfully! Tax calculator has been prefilled.")
                     
-                    if extracted_data:
-                        st.session_state.extracted_tax_data = extracted_data
-                        st.session_state.edited_data = False
+                    with st.expander("View Extracted Data"):
+                        st.json(extracted_data.to_dict())
 
-                        json_file_path = generate_itr1_json(extracted_data)
-                        st.session_state.json_file_path = json_file_path
+                    def enable_edit_mode():
+                        st.session_state.edited_data = True
+                        st.rerun()
 
-                        st.session_state.tax_calculated = False
-                        
-                        st.success("✅ Data extracted successfully! Tax calculator has been prefilled.")
-                        
-                        with st.expander("View Extracted Data"):
-                            st.json(extracted_data)
-
-                        def enable_edit_mode():
-                            st.session_state.edited_data = True
-                            st.rerun()
-
-                        st.button("Edit Extracted Data", key="edit_data_button", on_click=enable_edit_mode)
-            
-                    else:
-                        st.error("Could not extract structured data. Please check the PDF format or try another file.")
-                        st.code(response_text)
-
-                        st.info("👉 Go to the 'Income Tax Calculator' tab to calculate your tax and then download your ITR-1 JSON file from the 'Download ITR-1 JSON' tab.")
-                
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                    st.button("Edit Extracted Data", key="edit_data_button", on_click=enable_edit_mode)
         if st.session_state.get("edited_data", False):
             edit_extracted_data()
 
 def tax_calculator():
     st.header("Income Tax Calculator - India")
 
-    financial_year = st.selectbox("Select Financial Year", ["2024-25", "2023-24"])
-    age_group = st.radio("Select Age Group", ["Below 60", "60-80", "Above 80"])
+    financial_year = st.selectbox("Select Financial Year", FINANCIAL_YEARS)
+    age_group = st.radio("Select Age Group", AGE_GROUPS)
+    caps = rules_for(financial_year).deduction_caps
 
     tax_data = st.session_state.extracted_tax_data or {}
+    derived = st.session_state.derived
+    prefill = derived.get("calc_prefill", (tax_data, financial_year), form_values)
 
     st.subheader("Income Details")
     col1, col2 = st.columns(2)
@@ -421,50 +465,50 @@ def tax_calculator():
         salary_income = st.number_input(
             "Income from Salary (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("salary_income", 0)))
+            value=prefill["salary_income"]
         )
         
         interest_income = st.number_input(
             "Income from Interest (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("interest_income", 0)))
+            value=prefill["interest_income"]
         )
         
         rental_income = st.number_input(
             "Rental Income (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("rental_income", 0)))
+            value=prefill["rental_income"]
         )
         
         digital_assets_income = st.number_input(
             "Income from Digital Assets (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("digital_assets_income", 0)))
+            value=prefill["digital_assets_income"]
         )
     
     with col2:
         exempt_allowances = st.number_input(
             "Exempt Allowances (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("exempt_allowances", 0)))
+            value=prefill["exempt_allowances"]
         )
         
         home_loan_self = st.number_input(
             "Interest on Home Loan - Self Occupied (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("home_loan_self", 0)))
+            value=prefill["home_loan_self"]
         )
         
         home_loan_letout = st.number_input(
             "Interest on Home Loan - Let Out (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("home_loan_letout", 0)))
+            value=prefill["home_loan_letout"]
         )
         
         other_income = st.number_input(
             "Other Income (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("other_income", 0)))
+            value=prefill["other_income"]
         )
 
     st.subheader("Deductions")
@@ -473,82 +517,87 @@ def tax_calculator():
     with col1:
         deduction_80C = st.number_input(
             "Basic Deductions - 80C (₹)", 
-            min_value=0, max_value=150000, 
-            value=min(int(float(tax_data.get("deduction_80C", 0))), 150000)
+            min_value=0, max_value=caps["deduction_80C"], 
+            value=prefill["deduction_80C"]
         )
         
         deduction_80D = st.number_input(
             "Medical Insurance - 80D (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("deduction_80D", 0)))
+            value=prefill["deduction_80D"]
         )
         
         deduction_80EEA = st.number_input(
             "Interest on Housing Loan - 80EEA (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("deduction_80EEA", 0)))
+            value=prefill["deduction_80EEA"]
         )
         
         deduction_80CCD2 = st.number_input(
             "Employer's NPS - 80CCD(2) (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("deduction_80CCD2", 0)))
+            value=prefill["deduction_80CCD2"]
         )
     
     with col2:
         deduction_80TTA = st.number_input(
             "Interest from Deposits - 80TTA (₹)", 
-            min_value=0, max_value=10000, 
-            value=min(int(float(tax_data.get("deduction_80TTA", 0))), 10000)
+            min_value=0, max_value=caps["deduction_80TTA"], 
+            value=prefill["deduction_80TTA"]
         )
         
         deduction_80G = st.number_input(
             "Donations to Charity - 80G (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("deduction_80G", 0)))
+            value=prefill["deduction_80G"]
         )
         
         deduction_80CCD = st.number_input(
             "Employee's NPS - 80CCD (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("deduction_80CCD", 0)))
+            value=prefill["deduction_80CCD"]
         )
         
         other_deductions = st.number_input(
             "Other Deductions (₹)", 
             min_value=0, 
-            value=int(float(tax_data.get("other_deductions", 0)))
+            value=prefill["other_deductions"]
         )
 
+    entered_values = {
+        "salary_income": salary_income,
+        "interest_income": interest_income,
+        "rental_income": rental_income,
+        "digital_assets_income": digital_assets_income,
+        "other_income": other_income,
+        "deduction_80C": deduction_80C,
+        "deduction_80D": deduction_80D,
+        "deduction_80EEA": deduction_80EEA,
+        "deduction_80CCD2": deduction_80CCD2,
+        "deduction_80TTA": deduction_80TTA,
+        "deduction_80G": deduction_80G,
+        "deduction_80CCD": deduction_80CCD,
+        "other_deductions": other_deductions,
+    }
+    with timed(None, "compute"):
+        # The 80D limit for parents follows the optimiser's checkbox below.
+        calculation_results = compute_tax(entered_values, age_group, financial_year, derived,
+                                          parents_senior=st.session_state.get("optimizer_parents_senior", False))
+    st.caption(
+        f"Live estimate: Old Regime ₹{calculation_results['tax_old']:,} · New Regime ₹{calculation_results['tax_new']:,} "
+        f"· {calculation_results['recommended_regime']} saves ₹{calculation_results['tax_saving']:,}"
+    )
+    show_regime_optimizer(entered_values, age_group, financial_year)
+
     if st.button("Calculate Tax"):
-        total_income = (salary_income + interest_income + rental_income + 
-                        digital_assets_income + other_income)
-        
-        total_deductions = (deduction_80C + deduction_80D + deduction_80EEA + 
-                            deduction_80CCD2 + deduction_80TTA + deduction_80G + 
-                            deduction_80CCD + other_deductions)
-
-        taxable_income_old = max(0, total_income - total_deductions)
-        taxable_income_new = max(0, total_income - 50000) 
-
-        tax_old = calculate_old_regime_tax(taxable_income_old, age_group)
-        tax_new = calculate_new_regime_tax(taxable_income_new)
-
-        recommended_regime = "New Regime" if tax_new < tax_old else "Old Regime"
-        tax_saving = abs(tax_old - tax_new)
-
-        calculation_results = {
-            "total_income": total_income,
-            "total_deductions": total_deductions,
-            "taxable_income_old": taxable_income_old,
-            "taxable_income_new": taxable_income_new,
-            "tax_old": tax_old,
-            "tax_new": tax_new,
-            "recommended_regime": recommended_regime,
-            "tax_saving": tax_saving,
-            "age_group": age_group,
-            "financial_year": financial_year
-        }
+        total_income = calculation_results["total_income"]
+        total_deductions = calculation_results["total_deductions"]
+        taxable_income_old = calculation_results["taxable_income_old"]
+        taxable_income_new = calculation_results["taxable_income_new"]
+        tax_old = calculation_results["tax_old"]
+        tax_new = calculation_results["tax_new"]
+        recommended_regime = calculation_results["recommended_regime"]
+        tax_saving = calculation_results["tax_saving"]
         
         st.session_state.calculation_results = calculation_results
         st.session_state.tax_calculated = True
@@ -569,114 +618,201 @@ def tax_calculator():
             st.success(f"Recommended: {recommended_regime} (Save ₹{tax_saving:,})")
 
         if st.session_state.extracted_tax_data:
-            updated_data = st.session_state.extracted_tax_data.copy()
-
-            updated_data["salary_income"] = salary_income
-            updated_data["interest_income"] = interest_income
-            updated_data["rental_income"] = rental_income
-            updated_data["digital_assets_income"] = digital_assets_income
-            updated_data["exempt_allowances"] = exempt_allowances
-            updated_data["home_loan_self"] = home_loan_self
-            updated_data["home_loan_letout"] = home_loan_letout
-            updated_data["other_income"] = other_income
-
-            updated_data["deduction_80C"] = deduction_80C
-            updated_data["deduction_80D"] = deduction_80D
-            updated_data["deduction_80EEA"] = deduction_80EEA
-            updated_data["deduction_80CCD2"] = deduction_80CCD2
-            updated_data["deduction_80TTA"] = deduction_80TTA
-            updated_data["deduction_80G"] = deduction_80G
-            updated_data["deduction_80CCD"] = deduction_80CCD
-            updated_data["other_deductions"] = other_deductions
-            
+            updated_data = st.session_state.extracted_tax_data.replace(
+                entered_values,
+                exempt_allowances=exempt_allowances,
+                home_loan_self=home_loan_self,
+                home_loan_letout=home_loan_letout,
+            )
+
             st.session_state.extracted_tax_data = updated_data
-            json_file_path = generate_itr1_json(updated_data, calculation_results)
-            st.session_state.json_file_path = json_file_path
+            st.session_state.itr1_json = generate_itr1_json(updated_data, calculation_results)
 
             st.info("✅ Tax calculations complete! You can now download your ITR-1 JSON file from the 'Download ITR-1 JSON' tab.")
 
-def calculate_old_regime_tax(income, age_group):
+def show_regime_optimizer(entered_values, age_group, financial_year):
+    with st.expander("🔎 Optimise deductions across regimes"):
+        col1, col2 = st.columns(2)
+        with col1:
+            budget = st.number_input("Extra amount you can invest this year (₹)", min_value=0, value=0, step=5000,
+                                     key="optimizer_budget")
+        with col2:
+            parents_senior = st.checkbox("Parents are senior citizens", key="optimizer_parents_senior")
 
-    tax = 0
-    
-    if age_group == "Below 60":
-        if income <= 250000:
-            tax = 0
-        elif income <= 500000:
-            tax = (income - 250000) * 0.05
-        elif income <= 1000000:
-            tax = 12500 + (income - 500000) * 0.20
-        else:
-            tax = 112500 + (income - 1000000) * 0.30
-    
-    elif age_group == "60-80":
-        if income <= 300000:
-            tax = 0
-        elif income <= 500000:
-            tax = (income - 300000) * 0.05
-        elif income <= 1000000:
-            tax = 10000 + (income - 500000) * 0.20
-        else:
-            tax = 110000 + (income - 1000000) * 0.30
-    
-    else:  
-        if income <= 500000:
-            tax = 0
-        elif income <= 1000000:
-            tax = (income - 500000) * 0.20
-        else:
-            tax = 100000 + (income - 1000000) * 0.30
-    
-    tax += tax * 0.04
-    
-    return round(tax)
+        result = st.session_state.derived.get(
+            "optimizer", (entered_values, age_group, budget, parents_senior, financial_year),
+            lambda *inputs: optimise_regime(*inputs[:4], financial_year=inputs[4])
+        )
 
-def calculate_new_regime_tax(income):
-    tax = 0
-    
-    if income <= 300000:
-        tax = 0
-    elif income <= 600000:
-        tax = (income - 300000) * 0.05
-    elif income <= 900000:
-        tax = 15000 + (income - 600000) * 0.10
-    elif income <= 1200000:
-        tax = 45000 + (income - 900000) * 0.15
-    elif income <= 1500000:
-        tax = 90000 + (income - 1200000) * 0.20
-    else:
-        tax = 150000 + (income - 1500000) * 0.30
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Lowest Tax", f"₹{result['tax']:,}", help=result["recommended_regime"])
+        col2.metric("Extra Investment", f"₹{result['extra_investment']:,}")
+        col3.metric("Saving vs Current", f"₹{result['saving_vs_current']:,}")
+        st.write(f"Recommended: **{result['recommended_regime']}**")
+
+        st.write("Best Old Regime plan within your budget:")
+        st.dataframe(
+            [
+                {"Section": SECTION_LABELS[name], "Claimed now": f"₹{result['current'][name]:,}",
+                 "Plan": f"₹{amount:,}"}
+                for name, amount in result["old_regime_plan"].items()
+            ],
+            hide_index=True,
+        )
+        st.caption(
+            f"Old Regime tax with this plan: ₹{result['old_regime_tax']:,} "
+            f"(₹{result['old_regime_extra_investment']:,} extra investment) · New Regime: ₹{result['tax_new']:,}"
+        )
 
-    tax += tax * 0.04
-    
-    return round(tax)
+        old_breakeven = result["breakeven_deductions"]["Old Regime"]
+        new_breakeven = result["breakeven_deductions"]["New Regime"]
+        if old_breakeven is None:
+            st.info("At this income the Old Regime cannot match the New Regime with any amount of deductions.")
+        else:
+            col1, col2 = st.columns(2)
+            col1.metric("Old Regime breakeven", f"₹{old_breakeven:,}",
+                        help="Total deductions from which the Old Regime costs no more than the New Regime")
+            col2.metric("New Regime breakeven", "never cheaper" if new_breakeven is None else f"₹{new_breakeven:,}",
+                        help="Total deductions up to which the New Regime is still cheaper")
+            if result["additional_deductions_to_breakeven"] == 0:
+                st.info(f"The Old Regime is already at least as good once deductions reach ₹{old_breakeven:,}.")
+            else:
+                st.info(
+                    f"Breakeven: the Old Regime matches the New Regime at ₹{old_breakeven:,} of total deductions, "
+                    f"₹{result['additional_deductions_to_breakeven']:,} more than you claim now "
+                    f"(these sections allow up to ₹{result['max_deductions']:,})."
+                )
+        st.caption(f"{result['plans_evaluated']:,} plans evaluated in {result['seconds'] * 1000:.1f} ms")
+
+def stream_advisor_answer(prompt, on_wait=None):
+    """Yields the advisor's answer in pieces as the model generates it."""
+    for chunk in model.generate_content(prompt, stream=True, on_wait=on_wait):
+        if chunk.parts:
+            yield chunk.text
+
+def show_turn_latency(message):
+    if message.get("cached"):
+        st.caption(f"⚡ Answered from cache in {message['total_seconds'] * 1000:.0f} ms")
+    elif "first_token_seconds" in message:
+        st.caption(
+            f"First token {message['first_token_seconds']:.2f}s · total {message['total_seconds']:.2f}s"
+        )
+
+ADVISOR_INSTRUCTION = "You are an expert Indian tax advisor. Answer the following tax-related question thoroughly and accurately: "
+MESSAGES_PER_PAGE = 10
+STREAM_REDRAW_SECONDS = 0.05
 
 def tax_advisor_chatbot():
     st.header("AI Tax Advisor")
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = ConversationMemory(st.session_state.messages)
+    if "visible_messages" not in st.session_state:
+        st.session_state.visible_messages = MESSAGES_PER_PAGE
+    conversation = st.session_state.conversation
+
+    # An answer still marked pending was cut short by a rerun: the Stop button,
+    # or any other widget used while it streamed. Keep what arrived.
+    pending = st.session_state.pop("pending_answer", None)
+    if pending is not None:
+        stopped = st.session_state.get("stop_answer")
+        pending["content"] = "".join(pending.pop("pieces")) + (
+            "\n\n_(stopped)_" if stopped else "\n\n_(interrupted - ask again for the full answer)_")
+        pending["total_seconds"] = time.perf_counter() - pending.pop("started")
+        conversation.append(pending)
+
+    hidden = len(conversation.messages) - st.session_state.visible_messages
+    if hidden > 0 or conversation.dropped_messages:
+        if hidden > 0 and st.button(f"Show earlier messages ({hidden} hidden)", key="show_earlier_messages"):
+            st.session_state.visible_messages += MESSAGES_PER_PAGE
+            st.rerun()
+        if conversation.dropped_messages:
+            st.caption(f"{conversation.dropped_messages} older messages are kept only as a summary for context.")
   
-    for message in st.session_state.messages:
+    for message in conversation.messages[-st.session_state.visible_messages:]:
         with st.chat_message(message["role"]):
             st.write(message["content"])
+            show_turn_latency(message)
 
     user_input = st.chat_input("Ask about Indian taxes, deductions, or ITR filing:")
     
     if user_input:
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        tax_prompt = conversation.build_prompt(ADVISOR_INSTRUCTION, user_input)
+        # Follow-ups depend on the conversation so far and bypass the answer cache.
+        use_answer_cache = not is_follow_up(user_input)
+        # The answer cache is shared by every session, so only answers written
+        # without this user's earlier turns (salary, investments...) go into it.
+        cacheable_answer = use_answer_cache and tax_prompt == ADVISOR_INSTRUCTION + user_input
+        conversation.append({"role": "user", "content": user_input})
 
         with st.chat_message("user"):
             st.write(user_input)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                tax_prompt = "You are an expert Indian tax advisor. Answer the following tax-related question thoroughly and accurately: " + user_input
-                response = model.generate_content(tax_prompt)
-
-                st.write(response.text)
-
-                st.session_state.messages.append({"role": "assistant", "content": response.text})
+            started = time.perf_counter()
+            cached_answer = get_answer_cache().get(user_input) if use_answer_cache else None
+            if use_answer_cache:
+                METRICS.inc("answer_cache_total", result="miss" if cached_answer is None else "hit")
+            if cached_answer is not None:
+                elapsed = time.perf_counter() - started
+                answer = {"role": "assistant", "content": cached_answer, "cached": True,
+                          "first_token_seconds": elapsed, "total_seconds": elapsed}
+                st.write(cached_answer)
+                show_turn_latency(answer)
+                conversation.append(answer)
+                return
+
+            st.button("⏹ Stop", key="stop_answer")
+            placeholder = st.empty()
+            placeholder.markdown("_Thinking..._")
+
+            # The pieces are joined once at the end; while streaming, the text is
+            # only joined when the placeholder is redrawn, at most every
+            # STREAM_REDRAW_SECONDS.
+            pieces = []
+            answer = {"role": "assistant", "content": "", "pieces": pieces, "started": time.perf_counter()}
+            st.session_state.pending_answer = answer
+
+            METRICS.inc("model_calls_total", kind="advisor")
+            METRICS.inc("model_prompt_tokens_total", estimate_tokens(tax_prompt), kind="advisor")
+            try:
+                queued = lambda ahead: show_queue_position(placeholder, ahead)
+                redrawn = 0.0
+                for piece in stream_advisor_answer(tax_prompt, queued):
+                    now = time.perf_counter()
+                    if "first_token_seconds" not in answer:
+                        answer["first_token_seconds"] = now - answer["started"]
+                    pieces.append(piece)
+                    if now - redrawn >= STREAM_REDRAW_SECONDS:
+                        placeholder.markdown("".join(pieces) + "▌")
+                        redrawn = now
+            except BrokerBusy as e:
+                del st.session_state.pending_answer
+                placeholder.empty()
+                st.warning(f"⏳ {e}")
+                return
+            except Exception as e:
+                METRICS.inc("model_errors_total", kind="advisor")
+                del st.session_state.pending_answer
+                placeholder.empty()
+                st.error(f"Error: {e}")
+                return
+
+            del st.session_state.pending_answer
+            answer["content"] = "".join(answer.pop("pieces"))
+            answer["total_seconds"] = time.perf_counter() - answer.pop("started")
+            answer.setdefault("first_token_seconds", answer["total_seconds"])
+            METRICS.observe("advisor_first_token", answer["first_token_seconds"])
+            METRICS.observe("advisor_answer", answer["total_seconds"])
+            METRICS.inc("model_response_tokens_total", estimate_tokens(answer["content"]), kind="advisor")
+            placeholder.markdown(answer["content"])
+            show_turn_latency(answer)
+
+            conversation.append(answer)
+            if answer["content"] and cacheable_answer:
+                get_answer_cache().put(user_input, answer["content"])
 
 def download_json_tab():
     st.header("Download ITR-1 JSON File")
@@ -689,7 +825,7 @@ def download_json_tab():
         st.warning("Please calculate your tax in the 'Income Tax Calculator' tab before downloading the JSON file.")
         return
     
-    if st.session_state.json_file_path and os.path.exists(st.session_state.json_file_path):
+    if st.session_state.itr1_json:
         st.success("Your ITR-1 JSON file is ready for download!")
         
         if st.session_state.calculation_results:
@@ -724,17 +860,61 @@ def download_json_tab():
         8. Complete and submit your ITR
         """)
         
-        with open(st.session_state.json_file_path, "rb") as f:
-            st.download_button(
-                label="📥 Download ITR-1 JSON File",
-                data=f,
-                file_name="itr1_prefilled.json",
-                mime="application/json",
-                key="download_tab_button"
-            )
+        compact = st.checkbox("Compact encoding (smaller file, no indentation)", key="compact_itr1_json")
+        json_bytes = st.session_state.derived.get(
+            "itr1_bytes", (st.session_state.itr1_json, compact), dump_json_bytes
+        )
+        st.download_button(
+            label="📥 Download ITR-1 JSON File",
+            data=json_bytes,
+            file_name="itr1_prefilled.json",
+            mime="application/json",
+            key="download_tab_button"
+        )
     else:
         st.error("An error occurred with the JSON file. Please try calculating your tax again.")
 
+def timed_tab(name, render):
+    """Renders a tab and records how long its part of this rerun took."""
+    started = time.perf_counter()
+    render()
+    st.session_state.tab_timings[name] = time.perf_counter() - started
+
+def show_tab_timings():
+    timings = st.session_state.tab_timings
+    if not timings:
+        return
+    derived = st.session_state.derived
+    with st.sidebar.expander("⏱️ Rerun timings"):
+        for name, seconds in timings.items():
+            st.write(f"{name}: {seconds * 1000:.1f} ms")
+        st.caption(f"Derived values: {derived.computed} computed, {derived.reused} reused")
+
+def show_admin_panel():
+    """Process-wide metrics for operators; shown only when the server sets TAX_ASSISTANT_ADMIN=1."""
+    # Not a query parameter: any visitor could then reset the shared metrics.
+    if not ADMIN_PANEL:
+        return
+    with st.sidebar.expander("🛠️ Metrics (admin)"):
+        snapshot = METRICS.snapshot()
+        if snapshot["stages"]:
+            st.dataframe(
+                [
+                    {"stage": stage, "count": row["count"], "mean ms": round(row["mean_seconds"] * 1000, 1),
+                     "max ms": round(row["max_seconds"] * 1000, 1)}
+                    for stage, row in sorted(snapshot["stages"].items())
+                ],
+                hide_index=True,
+            )
+        st.json(snapshot["counters"])
+        st.write("Model broker:")
+        st.json(get_broker().stats())
+        st.download_button("Download Prometheus metrics", METRICS.prometheus_text(), file_name="metrics.prom",
+                           mime="text/plain", key="download_metrics")
+        if st.button("Reset metrics", key="reset_metrics"):
+            METRICS.reset()
+            st.rerun()
+
 def home():
     st.title("🚀 AI-Powered Tax Filing Co-Pilot")
     st.subheader("Upload Form 16 & get tax details automatically!")
@@ -747,16 +927,22 @@ def home():
     ])
     
     with tab1:
-        form16_extraction()
+        timed_tab("Upload Form 16", form16_extraction)
     
     with tab2:
-        tax_calculator()
+        timed_tab("Income Tax Calculator", tax_calculator)
     
     with tab3:
-        tax_advisor_chatbot()
+        timed_tab("Tax Advisor", tax_advisor_chatbot)
     
     with tab4:
-        download_json_tab()
+        timed_tab("Download ITR-1 JSON", download_json_tab)
+
+    show_session_controls()
+    save_session()
+    show_tab_timings()
+    show_admin_panel()
+    start_metrics_exporter()
 
 if __name__ == "__main__":
     home()
@@ -0,0 +1,147 @@
+"""Command-line interface to the Form 16 to ITR-1 pipeline.
+
+    tax-assistant itr1 form16.pdf -o itr1.json
+    cat form16.pdf | tax-assistant itr1 -
+    tax-assistant extract form16.pdf
+    tax-assistant compute extracted.json --age-group 60-80
+    tax-assistant batch form16s/ output/
+    tax-assistant table employees.csv results.csv
+
+Inputs may be a Form 16 PDF or a JSON object of already extracted fields,
+read from a file or from stdin ("-"). The model is only used when an API key
+is available (--api-key or GOOGLE_API_KEY), or with --backend replay, and the
+TRACES rules cannot read the document.
+"""
+import argparse
+import json
+import os
+import sys
+
+from form16 import dump_json_bytes
+from tax_engine import AGE_GROUPS, DEFAULT_FINANCIAL_YEAR, FINANCIAL_YEARS
+from tax_pipeline import (MODEL_BACKENDS, ExtractionError, compute_tax, create_model, extract_form16, run_pipeline,
+                          timed)
+
+
+def _read_input(path):
+    if path == "-":
+        return sys.stdin.buffer.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _load(raw):
+    """Returns PDF bytes unchanged, or the decoded JSON object of extracted fields."""
+    if raw.lstrip()[:5] == b"%PDF-":
+        return raw
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("input must be a Form 16 PDF or a JSON object of extracted fields")
+    return data
+
+
+def _write_output(document, path, compact=False):
+    output = dump_json_bytes(document, compact)
+    if path in (None, "-"):
+        sys.stdout.buffer.write(output + b"\n")
+        sys.stdout.flush()
+    else:
+        with open(path, "wb") as f:
+            f.write(output)
+
+
+def _model(args):
+    api_key = args.api_key or os.environ.get("GOOGLE_API_KEY")
+    if args.backend == "gemini" and not api_key:
+        return None
+    return create_model(api_key, backend=args.backend)
+
+
+def _cache(args):
+    if not args.cache:
+        return None
+    from extraction_cache import ExtractionCache
+    return ExtractionCache(args.cache)
+
+
+def _report_timings(timings):
+    for stage, seconds in timings.items():
+        print(f"{stage:>10}: {seconds * 1000:9.1f} ms", file=sys.stderr)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["batch"]:
+        import batch
+        return batch.main(argv[1:])
+    if argv[:1] == ["table"]:
+        import batch_tax
+        return batch_tax.main(argv[1:])
+
+    parser = argparse.ArgumentParser(prog="tax-assistant", description="Form 16 extraction and ITR-1 generation.")
+    parser.add_argument("--api-key", default=None, help="Gemini API key (defaults to GOOGLE_API_KEY)")
+    parser.add_argument("--cache", default=os.path.join(".tax_assistant", "extraction_cache.sqlite3"),
+                        help="Extraction cache path ('' disables the cache)")
+    parser.add_argument("--backend", choices=sorted(MODEL_BACKENDS),
+                        default=os.environ.get("TAX_ASSISTANT_MODEL_BACKEND", "gemini"),
+                        help="Model backend; 'replay' answers from recorded responses offline")
+    parser.add_argument("--timings", action="store_true", help="Print per-stage timings to stderr")
+    parser.add_argument("--metrics", help="Export stage timings and counters to this file (.jsonl for JSON lines)")
+    parser.add_argument("--compact", action="store_true", help="Write JSON without indentation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract = commands.add_parser("extract", help="Extract Form 16 fields as JSON")
+    extract.add_argument("input", help="Form 16 PDF, or - for stdin")
+    extract.add_argument("-o", "--output", help="Output file (default stdout)")
+
+    for name, help_text in (("compute", "Compute old and new regime tax"),
+                            ("itr1", "Run the full pipeline and emit ITR-1 JSON")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("input", help="Form 16 PDF or extracted-fields JSON, or - for stdin")
+        command.add_argument("-o", "--output", help="Output file (default stdout)")
+        command.add_argument("--age-group", choices=AGE_GROUPS, default=AGE_GROUPS[0])
+        command.add_argument("--financial-year", choices=FINANCIAL_YEARS, default=DEFAULT_FINANCIAL_YEAR)
+
+    commands.add_parser("batch", help="Process a directory or zip of PDFs (see batch.py --help)")
+    commands.add_parser("table", help="Compute tax for every row of a CSV or Parquet file (see batch_tax.py --help)")
+    args = parser.parse_args(argv)
+
+    timings = {}
+    try:
+        with timed(timings, "read_input"):
+            source = _load(_read_input(args.input))
+
+        if args.command == "extract":
+            if isinstance(source, dict):
+                parser.error("extract expects a PDF")
+            record, _ = extract_form16(source, _model(args), _cache(args), timings)
+            document = record.to_dict()
+        elif args.command == "compute":
+            if not isinstance(source, dict):
+                source, _ = extract_form16(source, _model(args), _cache(args), timings)
+            with timed(timings, "compute"):
+                document = compute_tax(source, args.age_group, args.financial_year)
+        else:
+            model = None if isinstance(source, dict) else _model(args)
+            document, _, _ = run_pipeline(source, model, args.age_group, args.financial_year,
+                                          _cache(args), timings)
+    except ExtractionError as e:
+        print(f"error: {e}", file=sys.stderr)
+        if e.response_text:
+            print(e.response_text, file=sys.stderr)
+        return 1
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    _write_output(document, args.output, args.compact)
+    if args.timings:
+        _report_timings(timings)
+    if args.metrics:
+        from metrics import METRICS
+        METRICS.export(args.metrics)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
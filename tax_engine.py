@@ -0,0 +1,242 @@
+"""Table-driven income tax slabs for scalar and NumPy array inputs.
+
+Slabs, the new regime standard deduction, the cess rate and the deduction
+caps for each financial year live in tax_rules.json. The file is validated
+and compiled into SlabTables once, at import, and every computation path
+looks its year up in RULES. Adding a year is a change to the file only.
+
+NumPy is imported only by the array functions, so scalar callers (the app and
+the CLI) start without it.
+"""
+import json
+import os
+from bisect import bisect_left
+
+AGE_GROUPS = ("Below 60", "60-80", "Above 80")
+# Limits every year must define: the calculator caps 80C and 80TTA, and the
+# regime optimiser plans 80CCD(1B), 80D (self and parents, each with a senior
+# citizen limit) and savings interest under 80TTA/80TTB.
+REQUIRED_CAPS = (
+    "deduction_80C",
+    "deduction_80CCD1B",
+    "deduction_80D_self",
+    "deduction_80D_self_senior",
+    "deduction_80D_parents",
+    "deduction_80D_parents_senior",
+    "deduction_80TTA",
+    "deduction_80TTB",
+)
+
+RULES_FILE = os.environ.get("TAX_ASSISTANT_RULES_FILE",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "tax_rules.json"))
+
+
+class SlabTable:
+    """Slab boundaries compiled with the cumulative tax due at each boundary."""
+
+    def __init__(self, slabs, cess_rate):
+        self.lowers = [lower for lower, _ in slabs]
+        self.rates = [rate for _, rate in slabs]
+        self.cess_rate = cess_rate
+
+        self.bases = [0.0]
+        for i in range(1, len(slabs)):
+            self.bases.append(round(self.bases[-1] + (self.lowers[i] - self.lowers[i - 1]) * self.rates[i - 1]))
+        self._arrays = None
+
+    def arrays(self):
+        """Returns (lowers, rates, bases) as NumPy arrays, built on first use."""
+        if self._arrays is None:
+            import numpy as np
+            self._arrays = tuple(np.array(values, dtype=np.float64) for values in (self.lowers, self.rates, self.bases))
+        return self._arrays
+
+    def tax(self, income):
+        """Returns the tax including cess on a single taxable income."""
+        i = max(bisect_left(self.lowers, income) - 1, 0)
+        tax = self.bases[i] + (income - self.lowers[i]) * self.rates[i]
+        tax += tax * self.cess_rate
+        return round(tax)
+
+    def tax_array(self, incomes):
+        """Returns the tax including cess for an array of taxable incomes."""
+        import numpy as np
+
+        lowers, rates, bases = self.arrays()
+        incomes = np.asarray(incomes, dtype=np.float64)
+        i = np.maximum(np.searchsorted(lowers, incomes, side="left") - 1, 0)
+        tax = bases[i] + (incomes - lowers[i]) * rates[i]
+        tax += tax * self.cess_rate
+        return np.rint(tax).astype(np.int64)
+
+
+def _check_slabs(slabs, where):
+    if not isinstance(slabs, list) or not slabs:
+        raise ValueError(f"{where}: slabs must be a non-empty list of [lower bound, rate] pairs")
+    lowers = []
+    for slab in slabs:
+        if (not isinstance(slab, list) or len(slab) != 2
+                or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in slab)):
+            raise ValueError(f"{where}: {slab!r} is not a [lower bound, rate] pair")
+        if not 0 <= slab[1] <= 1:
+            raise ValueError(f"{where}: rate {slab[1]} is outside 0-1")
+        lowers.append(slab[0])
+    if lowers[0] != 0:
+        raise ValueError(f"{where}: the first slab must start at 0")
+    if any(upper <= lower for lower, upper in zip(lowers, lowers[1:])):
+        raise ValueError(f"{where}: slab lower bounds must increase")
+    return [tuple(slab) for slab in slabs]
+
+
+def _check_amount(value, where):
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ValueError(f"{where}: expected a non-negative whole amount, got {value!r}")
+    return value
+
+
+def check_age_group(age_group):
+    """Raises ValueError unless age_group is one of AGE_GROUPS."""
+    if age_group not in AGE_GROUPS:
+        raise ValueError(f"Unknown age group {age_group!r}; expected one of {', '.join(AGE_GROUPS)}")
+
+
+class YearRules:
+    """The compiled rules for one financial year."""
+
+    def __init__(self, financial_year, definition):
+        where = f"tax rules {financial_year}"
+        try:
+            cess_rate = definition["cess_rate"]
+            caps = definition["deduction_caps"]
+            old_slabs = definition["old"]["slabs"]
+            new_slabs = definition["new"]["slabs"]
+            standard_deduction = definition["new"].get("standard_deduction", 0)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"{where}: missing {e}") from None
+        if not isinstance(cess_rate, (int, float)) or not 0 <= cess_rate <= 1:
+            raise ValueError(f"{where}: cess_rate must be between 0 and 1")
+        if not isinstance(caps, dict):
+            raise ValueError(f"{where}: deduction_caps must map fields to amounts")
+        missing_caps = [name for name in REQUIRED_CAPS if name not in caps]
+        if missing_caps:
+            raise ValueError(f"{where}: deduction_caps is missing {', '.join(missing_caps)}")
+        if not isinstance(old_slabs, dict) or set(old_slabs) != set(AGE_GROUPS):
+            raise ValueError(f"{where}: old regime slabs must be given for exactly {', '.join(AGE_GROUPS)}")
+
+        self.financial_year = financial_year
+        self.cess_rate = cess_rate
+        self.deduction_caps = {name: _check_amount(cap, f"{where} cap {name}") for name, cap in caps.items()}
+        self.standard_deduction = _check_amount(standard_deduction, f"{where} standard_deduction")
+        self.old_tables = {
+            age_group: SlabTable(_check_slabs(old_slabs[age_group], f"{where} old {age_group}"), cess_rate)
+            for age_group in AGE_GROUPS
+        }
+        self.new_table = SlabTable(_check_slabs(new_slabs, f"{where} new"), cess_rate)
+
+    def old_table(self, age_group):
+        # An unknown label is an error, as in age_group_codes, rather than
+        # silently taxed with another group's slabs.
+        check_age_group(age_group)
+        return self.old_tables[age_group]
+
+
+def load_rules(path=RULES_FILE):
+    """Reads, validates and compiles a rules file. Returns {financial year: YearRules}.
+
+    Raises ValueError describing the first problem found.
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            definitions = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path} is not valid JSON: {e}") from None
+    if not isinstance(definitions, dict) or not definitions:
+        raise ValueError(f"{path} must map financial years to rule definitions")
+    return {year: YearRules(year, definition) for year, definition in definitions.items()}
+
+
+RULES = load_rules()
+FINANCIAL_YEARS = tuple(sorted(RULES, reverse=True))
+DEFAULT_FINANCIAL_YEAR = FINANCIAL_YEARS[0]
+
+
+def rules_for(financial_year=None):
+    """Returns the YearRules for `financial_year` (default the latest year)."""
+    try:
+        return RULES[financial_year or DEFAULT_FINANCIAL_YEAR]
+    except KeyError:
+        raise ValueError(
+            f"No tax rules for financial year {financial_year}; known years are {', '.join(FINANCIAL_YEARS)}"
+        ) from None
+
+
+def calculate_old_regime_tax(income, age_group, financial_year=None):
+    return rules_for(financial_year).old_table(age_group).tax(income)
+
+
+def calculate_new_regime_tax(income, financial_year=None):
+    return rules_for(financial_year).new_table.tax(income)
+
+
+def deduction_limits(age_group, interest_income, parents_senior=False, financial_year=None):
+    """Limits of the deductions the regime optimiser plans, from the year's deduction_caps.
+
+    80C has a single limit. The NPS contribution is limited by 80CCD(1B). 80D allows one limit for
+    self and family and another for parents, each higher for senior
+    citizens. Savings interest is deductible under 80TTA, or under 80TTB
+    from 60, and never more than the interest earned.
+    """
+    check_age_group(age_group)
+    senior = age_group != "Below 60"
+    caps = rules_for(financial_year).deduction_caps
+    return {
+        "deduction_80C": caps["deduction_80C"],
+        "deduction_80CCD": caps["deduction_80CCD1B"],
+        "deduction_80D": (caps["deduction_80D_self_senior"] if senior else caps["deduction_80D_self"])
+        + (caps["deduction_80D_parents_senior"] if parents_senior else caps["deduction_80D_parents"]),
+        "deduction_80TTA": min(interest_income, caps["deduction_80TTB"] if senior else caps["deduction_80TTA"]),
+    }
+
+
+def age_group_codes(age_groups):
+    """Maps age group labels (or integer codes) to indexes into AGE_GROUPS.
+
+    Raises ValueError naming any label that is not in AGE_GROUPS, or any code
+    out of range, rather than taxing it with some other group's slabs.
+    """
+    import numpy as np
+
+    age_groups = np.asarray(age_groups)
+    if age_groups.dtype.kind in "iu":
+        invalid = (age_groups < 0) | (age_groups >= len(AGE_GROUPS))
+        if invalid.any():
+            raise ValueError(f"Age group codes must be 0-{len(AGE_GROUPS) - 1}, got {age_groups[invalid].flat[0]}")
+        return age_groups
+    codes = np.full(age_groups.shape, -1, dtype=np.int8)
+    for code, label in enumerate(AGE_GROUPS):
+        codes[age_groups == label] = code
+    if (codes < 0).any():
+        unknown = sorted({str(label) for label in np.unique(age_groups[codes < 0])})
+        shown = ", ".join(repr(label) for label in unknown[:5]) + (", ..." if len(unknown) > 5 else "")
+        raise ValueError(f"Unknown age group {shown}; expected one of {', '.join(AGE_GROUPS)}")
+    return codes
+
+
+def old_regime_tax(incomes, age_groups, financial_year=None):
+    """Vectorized calculate_old_regime_tax over arrays of incomes and age groups."""
+    import numpy as np
+
+    rules = rules_for(financial_year)
+    incomes = np.asarray(incomes, dtype=np.float64)
+    codes = np.broadcast_to(age_group_codes(age_groups), incomes.shape)
+    taxes = np.zeros(incomes.shape, dtype=np.int64)
+    for code, label in enumerate(AGE_GROUPS):
+        mask = codes == code
+        if mask.any():
+            taxes[mask] = rules.old_tables[label].tax_array(incomes[mask])
+    return taxes
+
+
+def new_regime_tax(incomes, financial_year=None):
+    """Vectorized calculate_new_regime_tax over an array of incomes."""
+    return rules_for(financial_year).new_table.tax_array(incomes)
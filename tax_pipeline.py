@@ -0,0 +1,414 @@
+"""UI-free Form 16 to ITR-1 pipeline: extract, parse, compute, emit.
+
+Nothing here imports Streamlit, so the same code serves the app, the CLI
+and batch workers. Errors are raised rather than reported.
+"""
+import io
+import os
+import time
+from contextlib import contextmanager
+
+from extraction_cache import ExtractionCache
+from form16 import (EXTRACTION_CONFIG, MODEL_NAME, SYSTEM_PROMPT, build_itr1_json, coerce_amount, estimate_tokens,
+                    iter_pdf_pages, parse_model_json, reduce_form16_pages, take_pages, validate_form16)
+from form16_chunks import CHUNK_TOKENS, extract_chunked
+from form16_ocr import ocr_available, ocr_blank_pages
+from form16_record import Form16Record
+from form16_rules import extract_with_rules
+from metrics import METRICS
+from tax_engine import (DEFAULT_FINANCIAL_YEAR, calculate_new_regime_tax, calculate_old_regime_tax, deduction_limits,
+                        rules_for)
+
+INCOME_FIELDS = ("salary_income", "interest_income", "rental_income", "digital_assets_income", "other_income")
+DEDUCTION_FIELDS = (
+    "deduction_80C",
+    "deduction_80D",
+    "deduction_80EEA",
+    "deduction_80CCD2",
+    "deduction_80TTA",
+    "deduction_80G",
+    "deduction_80CCD",
+    "other_deductions",
+)
+FORM_FIELDS = INCOME_FIELDS + ("exempt_allowances", "home_loan_self", "home_loan_letout") + DEDUCTION_FIELDS
+# Part of every extraction cache key. Bump it whenever the rules, chunk merging,
+# schema or validation change what an extraction returns, so entries written
+# by the old pipeline are not served again.
+PIPELINE_VERSION = 3
+
+
+class ExtractionError(Exception):
+    """Raised when no structured data could be extracted from a Form 16."""
+
+    def __init__(self, message, response_text=""):
+        super().__init__(message)
+        self.response_text = response_text
+
+
+@contextmanager
+def timed(timings, stage):
+    """Records the wall-clock time of the block in METRICS and, when timings is a dict, in timings[stage]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe(stage, elapsed)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def _gemini_model(api_key, model_name):
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key if api_key is not None else os.environ.get("GOOGLE_API_KEY", ""))
+    return genai.GenerativeModel(model_name)
+
+
+def _replay_model(api_key, model_name):
+    from replay_model import ReplayModel
+    return ReplayModel.from_env()
+
+
+# Each backend builds an object with generate_content(prompt, stream=False, generation_config=None).
+MODEL_BACKENDS = {"gemini": _gemini_model, "replay": _replay_model}
+
+
+def create_model(api_key=None, model_name=MODEL_NAME, backend=None):
+    """Returns the generative model for a backend in MODEL_BACKENDS.
+
+    The backend defaults to TAX_ASSISTANT_MODEL_BACKEND, then "gemini".
+    """
+    backend = backend or os.environ.get("TAX_ASSISTANT_MODEL_BACKEND", "gemini")
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}; choose from {', '.join(MODEL_BACKENDS)}")
+    return MODEL_BACKENDS[backend](api_key, model_name)
+
+
+def _ocr_pages(pdf_bytes, pages, cache, timings, first_page=0):
+    """OCRs the blank pages from first_page on; returns (pages, ocr_stats or None)."""
+    if all(page.strip() for page in pages[first_page:]):
+        return pages, None
+    with timed(timings, "ocr"):
+        pages, ocr_stats = ocr_blank_pages(pdf_bytes, pages, cache.ocr_pages if cache else None,
+                                           first_page=first_page)
+    METRICS.inc("ocr_pages_total", ocr_stats["ocr_pages"], source="ocr")
+    METRICS.inc("ocr_pages_total", ocr_stats["cached_pages"], source="cache")
+    METRICS.inc("ocr_pages_total", ocr_stats["failed_pages"], source="failed")
+    return pages, ocr_stats
+
+
+def extract_form16(pdf_bytes, model=None, cache=None, timings=None, model_name=MODEL_NAME,
+                   chunk_tokens=CHUNK_TOKENS, chunk_workers=4):
+    """Extracts Form 16 fields from PDF bytes.
+
+    Tries the extraction cache, then the TRACES rules, then the model in
+    schema-constrained JSON mode, validated against FORM16_SCHEMA. A reduced
+    prompt larger than chunk_tokens is extracted in concurrent chunks and
+    merged (form16_chunks); chunk_tokens=None always sends one prompt. Pages
+    are read only up to the end of Part B unless the prompt is chunked.
+    Returns (record, info), where record is a Form16Record and
+    info["source"] is "cache", "rules" or "model". For model extractions, info["prompt_stats"] holds the prompt size
+    and info["chunk_stats"] the chunk counts when chunking was used. Pages
+    without a text layer are OCRed first (form16_ocr), and info["ocr_stats"]
+    then says how many; a PDF with no readable text raises ExtractionError.
+    """
+    record, pending = prepare_form16(pdf_bytes, cache, timings, model_name, chunk_tokens)
+    if record is not None:
+        return record, pending
+    return extract_with_model(pending, model, cache, timings, chunk_workers)
+
+
+def prepare_form16(pdf_bytes, cache=None, timings=None, model_name=MODEL_NAME, chunk_tokens=CHUNK_TOKENS):
+    """The first, model-free half of extract_form16: cache, page text, OCR, rules and prompt.
+
+    Returns (record, info) when the cache or the rules give the answer, and
+    otherwise (None, pending), where pending is a plain dict to pass to
+    extract_with_model. Nothing here needs the model, so batch.py runs it in
+    worker processes.
+    """
+    key = ExtractionCache.make_key(pdf_bytes, SYSTEM_PROMPT, model_name, PIPELINE_VERSION) if cache else None
+    cached = cache.get(key) if cache else None
+    record = None
+    if cached:
+        try:
+            record = Form16Record.from_dict(cached[1])
+        except ValueError:
+            # Unusable entry; extract again and overwrite it.
+            METRICS.inc("extraction_cache_invalid_total")
+    if cache:
+        METRICS.inc("extraction_cache_total", result="hit" if record is not None else "miss")
+    if record is not None:
+        METRICS.inc("extractions_total", source="cache")
+        return record, {"source": "cache"}
+
+    with timed(timings, "pdf_text"):
+        page_iter = iter_pdf_pages(io.BytesIO(pdf_bytes))
+        pages = take_pages(page_iter, stop_when_complete=True)
+    pages, ocr_stats = _ocr_pages(pdf_bytes, pages, cache, timings)
+    text = "\n".join(pages) + "\n"
+    if not text.strip():
+        METRICS.inc("extraction_failures_total", reason="no_text")
+        raise ExtractionError(
+            "The PDF has no text layer. It looks scanned; install Tesseract and pytesseract to read scanned Form 16s."
+            if not ocr_available() else "No text could be read from the PDF, even with OCR."
+        )
+
+    with timed(timings, "rules"):
+        data = extract_with_rules(text)
+    if data is not None:
+        METRICS.inc("extractions_total", source="rules")
+        if cache:
+            cache.put(key, text, data)
+        info = {"source": "rules"}
+        if ocr_stats:
+            info["ocr_stats"] = ocr_stats
+        return Form16Record.from_dict(data), info
+
+    with timed(timings, "prompt"):
+        prompt_text, prompt_stats = reduce_form16_pages(pages)
+    chunked = bool(chunk_tokens) and prompt_stats["tokens_after"] > chunk_tokens
+    if chunked:
+        # A document long enough to chunk is read to the end: the
+        # annexures and any later employees come after the first Part B.
+        with timed(timings, "pdf_text"):
+            rest = list(page_iter)
+        if rest:
+            read = len(pages)
+            pages, more_ocr_stats = _ocr_pages(pdf_bytes, pages + rest, cache, timings, first_page=read)
+            if ocr_stats and more_ocr_stats:
+                ocr_stats = {name: ocr_stats[name] + more_ocr_stats[name] for name in ocr_stats}
+            else:
+                ocr_stats = ocr_stats or more_ocr_stats
+            text = "\n".join(pages) + "\n"
+            with timed(timings, "prompt"):
+                prompt_text, prompt_stats = reduce_form16_pages(pages)
+    return None, {
+        "key": key,
+        "pages": pages,
+        "text": text,
+        "prompt_text": prompt_text,
+        "prompt_stats": prompt_stats,
+        "chunk_tokens": chunk_tokens if chunked else None,
+        "ocr_stats": ocr_stats,
+    }
+
+
+def extract_with_model(pending, model, cache=None, timings=None, chunk_workers=4):
+    """The second half of extract_form16: extracts a prepared Form 16 with the model. Returns (record, info)."""
+    if model is None:
+        METRICS.inc("extraction_failures_total", reason="no_model")
+        raise ExtractionError("Form 16 layout not recognised and no model is configured.")
+    key, text = pending["key"], pending["text"]
+    info = {"source": "model", "prompt_stats": pending["prompt_stats"]}
+
+    if pending["chunk_tokens"]:
+        with timed(timings, "model"):
+            try:
+                data, chunk_stats = extract_chunked(pending["pages"], model, pending["chunk_tokens"], chunk_workers)
+            except ValueError as e:
+                METRICS.inc("extraction_failures_total", reason="parse")
+                raise ExtractionError(f"Could not parse any chunk of the model response: {e}") from e
+        info["chunk_stats"] = chunk_stats
+        # A result missing some chunks is returned but not cached, so the
+        # next run retries the chunks that failed.
+        cacheable = not chunk_stats["failed_chunks"]
+    else:
+        prompt = SYSTEM_PROMPT + "\n\n" + pending["prompt_text"]
+        METRICS.inc("model_calls_total", kind="extract")
+        METRICS.inc("model_prompt_tokens_total", estimate_tokens(prompt), kind="extract")
+        with timed(timings, "model"):
+            try:
+                response = model.generate_content(prompt, generation_config=EXTRACTION_CONFIG)
+            except Exception:
+                METRICS.inc("model_errors_total", kind="extract")
+                raise
+            response_text = response.text if response else ""
+        METRICS.inc("model_response_tokens_total", estimate_tokens(response_text), kind="extract")
+        with timed(timings, "parse"):
+            try:
+                data = validate_form16(parse_model_json(response_text))
+            except ValueError as e:
+                METRICS.inc("extraction_failures_total", reason="parse")
+                raise ExtractionError(f"Could not parse the model response: {e}", response_text) from e
+        cacheable = True
+
+    METRICS.inc("extractions_total", source="model")
+    if cache and cacheable:
+        cache.put(key, text, data)
+    if pending["ocr_stats"]:
+        info["ocr_stats"] = pending["ocr_stats"]
+    return Form16Record.from_dict(data), info
+
+
+class DerivedValues:
+    """Memo of derived values keyed on the inputs they were computed from.
+
+    A value is recomputed only when one of its inputs changed since the last
+    request under the same name, so editing one field re-derives only what
+    depends on it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.computed = 0
+        self.reused = 0
+
+    def get(self, name, inputs, compute):
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == inputs:
+            self.reused += 1
+            return entry[1]
+        value = compute(*inputs)
+        self._entries[name] = (inputs, value)
+        self.computed += 1
+        return value
+
+
+def _compute_now(name, inputs, compute):
+    return compute(*inputs)
+
+
+def field_value(data, name):
+    if isinstance(data, Form16Record):
+        return data.get(name, 0)
+    return int(coerce_amount(data.get(name)))
+
+
+def form_values(data, financial_year=None):
+    """Converts extracted values to the capped integers shown in the calculator and edit forms."""
+    values = {name: field_value(data, name) for name in FORM_FIELDS}
+    for name, cap in rules_for(financial_year).deduction_caps.items():
+        if name in values:
+            values[name] = min(values[name], cap)
+    return values
+
+
+def claimed_deductions(data, age_group="Below 60", financial_year=DEFAULT_FINANCIAL_YEAR, parents_senior=False):
+    """The amount of each of DEDUCTION_FIELDS that counts against income.
+
+    Sections with an age-dependent limit (tax_engine.deduction_limits) are
+    held to it; any other claim is held to its deduction_caps entry.
+    compute_tax and the regime optimiser both count deductions this way.
+    """
+    data = Form16Record.from_dict(data)
+    caps = rules_for(financial_year).deduction_caps
+    limits = deduction_limits(age_group, field_value(data, "interest_income"), parents_senior, financial_year)
+    return {name: min(field_value(data, name), limits.get(name, caps.get(name, float("inf"))))
+            for name in DEDUCTION_FIELDS}
+
+
+def compute_tax(data, age_group="Below 60", financial_year=DEFAULT_FINANCIAL_YEAR, derived=None,
+                parents_senior=False):
+    """Computes old and new regime tax for extracted or entered Form 16 values.
+
+    A dict is parsed with Form16Record.from_dict first, so amounts such as
+    "12,00,000" are read as numbers and a non-amount raises ValueError. Slabs, deduction limits and the standard deduction come from the rules
+    for `financial_year`; an unknown year raises ValueError. parents_senior
+    selects the higher 80D limit for parents. With a DerivedValues memo, only
+    the values whose inputs changed since the previous call are recomputed.
+    """
+    derive = derived.get if derived is not None else _compute_now
+    data = Form16Record.from_dict(data)
+    rules = rules_for(financial_year)
+    financial_year = rules.financial_year
+    incomes = tuple(field_value(data, name) for name in INCOME_FIELDS)
+    deductions = tuple(claimed_deductions(data, age_group, financial_year, parents_senior).values())
+
+    total_income = derive("total_income", incomes, lambda *values: sum(values))
+    total_deductions = derive("total_deductions", deductions, lambda *values: sum(values))
+
+    taxable_income_old = derive("taxable_income_old", (total_income, total_deductions),
+                                lambda income, deduction: max(0, income - deduction))
+    taxable_income_new = derive("taxable_income_new", (total_income, rules.standard_deduction),
+                                lambda income, standard: max(0, income - standard))
+
+    tax_old = derive("tax_old", (taxable_income_old, age_group, financial_year), calculate_old_regime_tax)
+    tax_new = derive("tax_new", (taxable_income_new, financial_year), calculate_new_regime_tax)
+
+    recommended_regime = "New Regime" if tax_new < tax_old else "Old Regime"
+
+    return {
+        "total_income": total_income,
+        "total_deductions": total_deductions,
+        "taxable_income_old": taxable_income_old,
+        "taxable_income_new": taxable_income_new,
+        "tax_old": tax_old,
+        "tax_new": tax_new,
+        "recommended_regime": recommended_regime,
+        "tax_saving": abs(tax_old - tax_new),
+        "age_group": age_group,
+        "financial_year": financial_year,
+    }
+
+
+def compute_tax_columns(columns, age_groups="Below 60", financial_year=DEFAULT_FINANCIAL_YEAR, parents_senior=False):
+    """Vectorized compute_tax over columns of many records.
+
+    `columns` maps field names to equal-length arrays (missing fields count
+    as 0, NaN as 0) and `age_groups` is one label or an array of labels or
+    codes; an unknown label raises ValueError. Returns a dict of NumPy
+    arrays keyed like compute_tax's result.
+    """
+    import numpy as np
+
+    from tax_engine import AGE_GROUPS, age_group_codes, new_regime_tax, old_regime_tax
+
+    rules = rules_for(financial_year)
+    length = len(next(iter(columns.values()))) if columns else 0
+
+    def column(name):
+        values = columns.get(name)
+        if values is None:
+            return np.zeros(length, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        return np.trunc(np.nan_to_num(values, nan=0.0)).astype(np.int64)
+
+    total_income = sum((column(name) for name in INCOME_FIELDS), np.zeros(length, dtype=np.int64))
+    # The limits for each age group, picked per row; the interest limit is applied below.
+    codes = np.broadcast_to(age_group_codes(age_groups), (length,))
+    group_limits = [deduction_limits(label, float("inf"), parents_senior, financial_year) for label in AGE_GROUPS]
+    total_deductions = np.zeros(length, dtype=np.int64)
+    for name in DEDUCTION_FIELDS:
+        values = column(name)
+        if name in group_limits[0]:
+            values = np.minimum(values, np.array([limits[name] for limits in group_limits])[codes])
+        elif name in rules.deduction_caps:
+            values = np.minimum(values, rules.deduction_caps[name])
+        if name == "deduction_80TTA":
+            values = np.minimum(values, column("interest_income"))
+        total_deductions += values
+
+    taxable_income_old = np.maximum(total_income - total_deductions, 0)
+    taxable_income_new = np.maximum(total_income - rules.standard_deduction, 0)
+    tax_old = old_regime_tax(taxable_income_old, age_groups, financial_year)
+    tax_new = new_regime_tax(taxable_income_new, financial_year)
+    return {
+        "total_income": total_income,
+        "total_deductions": total_deductions,
+        "taxable_income_old": taxable_income_old,
+        "taxable_income_new": taxable_income_new,
+        "tax_old": tax_old,
+        "tax_new": tax_new,
+        "recommended_regime": np.where(tax_new < tax_old, "New Regime", "Old Regime"),
+        "tax_saving": np.abs(tax_old - tax_new),
+    }
+
+
+def run_pipeline(source, model=None, age_group="Below 60", financial_year=DEFAULT_FINANCIAL_YEAR, cache=None,
+                 timings=None):
+    """Runs the full pipeline on PDF bytes or an already extracted data dict.
+
+    Returns (itr1_json, extracted_data, calculation_results), with the
+    extracted data as a Form16Record.
+    """
+    if isinstance(source, dict):
+        data = Form16Record.from_dict(source)
+    else:
+        data, _ = extract_form16(source, model, cache, timings)
+
+    with timed(timings, "compute"):
+        results = compute_tax(data, age_group, financial_year)
+    with timed(timings, "itr1_json"):
+        itr1_json = build_itr1_json(data, results)
+    return itr1_json, data, results
@@ -0,0 +1,20 @@
+from answer_cache import AnswerCache
+
+
+def test_old_and_new_regime_questions_do_not_share_an_answer(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"))
+    cache.put("What is the standard deduction under the old regime?", "50000")
+    assert cache.get("What is the standard deduction under the new regime?") is None
+
+
+def test_senior_and_super_senior_questions_do_not_share_an_answer(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"))
+    cache.put("What is the basic exemption limit for a senior citizen?", "300000")
+    assert cache.get("What is the basic exemption limit for a super senior citizen?") is None
+
+
+def test_a_rephrased_question_is_served_from_the_cache(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"))
+    cache.put("What is the standard deduction under the old regime?", "50000")
+    assert cache.get("what is the standard deduction under the old regime") == "50000"
+    assert cache.get("What's the standard deduction under the old regime?") == "50000"
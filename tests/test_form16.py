@@ -0,0 +1,35 @@
+import pytest
+
+from form16 import FORM16_FIELDS, parse_model_json, validate_form16
+
+
+def test_parse_skips_prose_fences_and_a_doubled_brace():
+    assert parse_model_json('Here you go:\n```json\n{ {"salary_income": "1,00,000"} }\n```') == {"salary_income": 100000}
+
+
+def test_parse_never_returns_an_object_nested_in_a_malformed_one():
+    with pytest.raises(ValueError):
+        parse_model_json('Sorry {"note": {"x": 1}, "salary_income": 12,,}')
+
+
+def test_parse_retries_at_the_next_top_level_object():
+    assert parse_model_json('{"note": {"x": 1},, } then {"salary_income": 12}') == {"salary_income": 12}
+
+
+@pytest.mark.parametrize("response_text", ['{}', '{"error": "I could not find Form 16 data"}'])
+def test_reply_without_form16_fields_is_rejected(response_text):
+    with pytest.raises(ValueError):
+        validate_form16(parse_model_json(response_text))
+
+
+def test_reply_missing_a_required_field_is_rejected():
+    with pytest.raises(ValueError, match="net_tax_payable"):
+        validate_form16({"salary_income": 1200000})
+
+
+def test_complete_reply_is_coerced_to_numbers():
+    data = dict.fromkeys(FORM16_FIELDS, "0")
+    data["salary_income"] = "₹12,00,000.00"
+    result = validate_form16(data)
+    assert result["salary_income"] == 1200000
+    assert result["net_tax_payable"] == 0
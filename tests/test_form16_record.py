@@ -0,0 +1,52 @@
+import pytest
+
+from form16 import FORM16_FIELDS
+from form16_record import RECORD_FIELDS, Form16Record
+
+
+def test_every_prompt_field_has_a_place_in_the_record():
+    # A field added to SYSTEM_PROMPT must also be appended to RECORD_FIELDS.
+    assert set(FORM16_FIELDS) <= set(RECORD_FIELDS)
+    assert len(set(RECORD_FIELDS)) == len(RECORD_FIELDS)
+
+
+def test_from_dict_parses_amounts_and_keeps_text():
+    record = Form16Record.from_dict({"salary_income": "12,00,000", "deduction_80C": "₹1,50,000.75", "PAN": "ABCDE1234F"})
+    assert record["salary_income"] == 1200000
+    assert record["deduction_80C"] == 150000
+    assert record["net_tax_payable"] == 0
+    assert record["PAN"] == "ABCDE1234F"
+    assert Form16Record.from_dict(record.to_dict()) == record
+    with pytest.raises(ValueError, match="salary_income"):
+        Form16Record.from_dict({"salary_income": "twelve lakh"})
+
+
+def test_replace_returns_the_same_record_when_nothing_changes():
+    record = Form16Record.from_dict({"salary_income": 1200000})
+    assert record.replace(salary_income="12,00,000") is record
+    changed = record.replace(salary_income=1300000, Name="A. Kumar")
+    assert changed["salary_income"] == 1300000 and changed["Name"] == "A. Kumar"
+    assert record["salary_income"] == 1200000 and "Name" not in record
+
+
+def test_bytes_round_trip():
+    record = Form16Record.from_dict({"salary_income": 1200000, "deduction_80CCD": 50000, "surcharge": -1, "PAN": "ABCDE1234F"})
+    assert Form16Record.from_bytes(record.to_bytes()) == record
+    empty = Form16Record()
+    assert Form16Record.from_bytes(empty.to_bytes()) == empty
+
+
+def test_from_bytes_rejects_other_data():
+    blob = Form16Record.from_dict({"salary_income": 1200000}).to_bytes()
+    for bad in (b"", b"not a record", blob[:-4]):
+        with pytest.raises(ValueError):
+            Form16Record.from_bytes(bad)
+
+
+def test_compute_tax_reads_formatted_amounts_in_a_dict():
+    from tax_pipeline import compute_tax, run_pipeline
+
+    formatted = {"salary_income": "12,00,000", "deduction_80C": "1,50,000"}
+    expected = compute_tax({"salary_income": 1200000, "deduction_80C": 150000})
+    assert compute_tax(formatted) == expected
+    assert run_pipeline(formatted)[2] == expected
@@ -0,0 +1,45 @@
+from regime_optimizer import optimise_regime
+from tax_pipeline import compute_tax
+
+
+def test_claims_above_the_limit_are_capped_consistently():
+    # 80D claimed above its 50000 limit for a Below 60 taxpayer with non-senior parents.
+    data = {"salary_income": 1200000, "deduction_80C": 50000, "deduction_80D": 90000}
+    result = optimise_regime(data, "Below 60", budget=0)
+    assert result["current"]["deduction_80D"] == 50000
+    assert all(result["plan"][name] >= amount for name, amount in result["current"].items())
+    assert result["saving_vs_current"] == 0
+
+
+def test_breakeven_for_each_regime():
+    data = {"salary_income": 1200000}
+    result = optimise_regime(data, "Below 60")
+    old_breakeven = result["breakeven_deductions"]["Old Regime"]
+    new_breakeven = result["breakeven_deductions"]["New Regime"]
+    assert new_breakeven == old_breakeven - 1
+
+    at_old = compute_tax(dict(data, other_deductions=old_breakeven))
+    at_new = compute_tax(dict(data, other_deductions=new_breakeven))
+    assert at_old["tax_old"] <= at_old["tax_new"]
+    assert at_new["tax_new"] < at_new["tax_old"]
+
+
+def test_limits_come_from_the_year_rules():
+    from regime_optimizer import deduction_limits
+
+    assert deduction_limits("Below 60", 80000) == {
+        "deduction_80C": 150000, "deduction_80CCD": 50000, "deduction_80D": 50000, "deduction_80TTA": 10000,
+    }
+    senior = deduction_limits("60-80", 80000, parents_senior=True)
+    assert senior["deduction_80D"] == 100000
+    assert senior["deduction_80TTA"] == 50000
+
+
+def test_saving_is_measured_against_compute_tax():
+    # A senior claiming more 80D and savings interest than the 80D and 80TTB limits allow.
+    data = {"salary_income": 900000, "interest_income": 70000, "deduction_80D": 120000, "deduction_80TTA": 70000}
+    for parents_senior in (False, True):
+        result = optimise_regime(data, "60-80", budget=0, parents_senior=parents_senior)
+        baseline = compute_tax(data, "60-80", parents_senior=parents_senior)
+        assert result["saving_vs_current"] == min(baseline["tax_old"], baseline["tax_new"]) - result["tax"]
+        assert result["saving_vs_current"] == 0
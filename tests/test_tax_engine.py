@@ -0,0 +1,184 @@
+import pytest
+
+from tax_engine import (AGE_GROUPS, calculate_new_regime_tax, calculate_old_regime_tax, new_regime_tax, old_regime_tax,
+                        rules_for)
+from tax_pipeline import compute_tax
+
+# Tax including 4% cess at each slab boundary, worked out by hand from the
+# published slabs, so a change to tax_rules.json has to change these too.
+NEW_REGIME = {
+    "2024-25": [(0, 0), (300000, 0), (700000, 20800), (1000000, 52000), (1200000, 83200), (1500000, 145600),
+                (2000000, 301600)],
+    "2023-24": [(0, 0), (300000, 0), (600000, 15600), (900000, 46800), (1000000, 62400), (1200000, 93600),
+                (1500000, 156000), (2000000, 312000)],
+}
+OLD_REGIME = {
+    "Below 60": [(250000, 0), (500000, 13000), (1000000, 117000), (1500000, 273000)],
+    "60-80": [(300000, 0), (500000, 10400), (1000000, 114400), (1500000, 270400)],
+    "Above 80": [(500000, 0), (1000000, 104000), (1500000, 260000)],
+}
+
+
+@pytest.mark.parametrize("financial_year, income, expected",
+                         [(year, income, tax) for year, cases in NEW_REGIME.items() for income, tax in cases])
+def test_new_regime_boundaries(financial_year, income, expected):
+    assert calculate_new_regime_tax(income, financial_year) == expected
+
+
+@pytest.mark.parametrize("financial_year", ["2024-25", "2023-24"])
+@pytest.mark.parametrize("age_group, income, expected",
+                         [(age, income, tax) for age, cases in OLD_REGIME.items() for income, tax in cases])
+def test_old_regime_boundaries(financial_year, age_group, income, expected):
+    assert calculate_old_regime_tax(income, age_group, financial_year) == expected
+
+
+@pytest.mark.parametrize("financial_year, standard_deduction, tax_new",
+                         [("2024-25", 75000, 71500), ("2023-24", 50000, 85800)])
+def test_compute_tax_uses_the_year_rules(financial_year, standard_deduction, tax_new):
+    data = {"salary_income": 1200000, "deduction_80C": 200000}
+    results = compute_tax(data, financial_year=financial_year)
+    assert rules_for(financial_year).standard_deduction == standard_deduction
+    assert results["taxable_income_new"] == 1200000 - standard_deduction
+    assert results["tax_new"] == tax_new
+    # 80C is capped at 150000 in both years.
+    assert results["total_deductions"] == 150000
+    assert results["tax_old"] == 132600
+
+
+def test_unknown_financial_year():
+    with pytest.raises(ValueError, match="No tax rules"):
+        rules_for("1999-00")
+
+
+def ladder_old_regime_tax(income, age_group):
+    """The if/elif ladder the slab tables replaced."""
+    if age_group == "Below 60":
+        if income <= 250000:
+            tax = 0
+        elif income <= 500000:
+            tax = (income - 250000) * 0.05
+        elif income <= 1000000:
+            tax = 12500 + (income - 500000) * 0.20
+        else:
+            tax = 112500 + (income - 1000000) * 0.30
+    elif age_group == "60-80":
+        if income <= 300000:
+            tax = 0
+        elif income <= 500000:
+            tax = (income - 300000) * 0.05
+        elif income <= 1000000:
+            tax = 10000 + (income - 500000) * 0.20
+        else:
+            tax = 110000 + (income - 1000000) * 0.30
+    else:
+        if income <= 500000:
+            tax = 0
+        elif income <= 1000000:
+            tax = (income - 500000) * 0.20
+        else:
+            tax = 100000 + (income - 1000000) * 0.30
+    tax += tax * 0.04
+    return round(tax)
+
+
+def ladder_new_regime_tax(income):
+    """The 2023-24 new regime if/elif ladder the slab tables replaced."""
+    if income <= 300000:
+        tax = 0
+    elif income <= 600000:
+        tax = (income - 300000) * 0.05
+    elif income <= 900000:
+        tax = 15000 + (income - 600000) * 0.10
+    elif income <= 1200000:
+        tax = 45000 + (income - 900000) * 0.15
+    elif income <= 1500000:
+        tax = 90000 + (income - 1200000) * 0.20
+    else:
+        tax = 150000 + (income - 1500000) * 0.30
+    tax += tax * 0.04
+    return round(tax)
+
+
+def boundary_incomes(table):
+    """Each slab's lower bound, one rupee and half a rupee either side of it, and the middle of each slab."""
+    incomes = {0, 1, 10 ** 8}
+    for lower, upper in zip(table.lowers, table.lowers[1:] + [table.lowers[-1] * 2 + 1]):
+        incomes.update((lower - 1, lower - 0.5, lower, lower + 0.5, lower + 1, (lower + upper) // 2))
+    return sorted(income for income in incomes if income >= 0)
+
+
+SLAB_TABLES = {}
+for _year in ("2024-25", "2023-24"):
+    SLAB_TABLES.update({f"{_year} old {age_group}": table for age_group, table in rules_for(_year).old_tables.items()})
+    SLAB_TABLES[f"{_year} new"] = rules_for(_year).new_table
+
+
+@pytest.mark.parametrize("name", sorted(SLAB_TABLES))
+def test_array_path_matches_scalar_path_at_boundaries(name):
+    table = SLAB_TABLES[name]
+    incomes = boundary_incomes(table)
+    assert table.tax_array(incomes).tolist() == [table.tax(income) for income in incomes]
+
+
+@pytest.mark.parametrize("financial_year", ["2024-25", "2023-24"])
+@pytest.mark.parametrize("age_group", ["Below 60", "60-80", "Above 80"])
+def test_old_regime_matches_the_ladder(financial_year, age_group):
+    incomes = boundary_incomes(rules_for(financial_year).old_table(age_group))
+    expected = [ladder_old_regime_tax(income, age_group) for income in incomes]
+    assert [calculate_old_regime_tax(income, age_group, financial_year) for income in incomes] == expected
+    assert old_regime_tax(incomes, age_group, financial_year).tolist() == expected
+
+
+def test_new_regime_matches_the_2023_24_ladder():
+    incomes = boundary_incomes(rules_for("2023-24").new_table)
+    expected = [ladder_new_regime_tax(income) for income in incomes]
+    assert [calculate_new_regime_tax(income, "2023-24") for income in incomes] == expected
+    assert new_regime_tax(incomes, "2023-24").tolist() == expected
+
+
+def test_mixed_age_groups_match_the_scalar_path():
+    incomes = [income for age_group in AGE_GROUPS for income in boundary_incomes(rules_for().old_table(age_group))]
+    age_groups = [AGE_GROUPS[i % len(AGE_GROUPS)] for i in range(len(incomes))]
+    expected = [calculate_old_regime_tax(income, age_group) for income, age_group in zip(incomes, age_groups)]
+    assert old_regime_tax(incomes, age_groups).tolist() == expected
+
+
+def test_unknown_age_group_label_is_rejected():
+    with pytest.raises(ValueError, match="Unknown age group"):
+        old_regime_tax([500000], ["below 60"])
+    with pytest.raises(ValueError, match="Unknown age group"):
+        calculate_old_regime_tax(500000, "below 60")
+    with pytest.raises(ValueError, match="Unknown age group"):
+        compute_tax({"salary_income": 500000}, "Senior")
+
+
+def test_year_rules_require_every_deduction_limit():
+    import json
+
+    from tax_engine import DEFAULT_FINANCIAL_YEAR, RULES_FILE, YearRules
+
+    with open(RULES_FILE, encoding="utf-8") as f:
+        definition = json.load(f)[DEFAULT_FINANCIAL_YEAR]
+    YearRules(DEFAULT_FINANCIAL_YEAR, definition)
+    definition["deduction_caps"] = {"deduction_80C": 150000, "deduction_80TTA": 10000}
+    with pytest.raises(ValueError, match="deduction_80D_self"):
+        YearRules(DEFAULT_FINANCIAL_YEAR, definition)
+
+
+def test_columns_count_deductions_like_compute_tax():
+    import numpy as np
+
+    from tax_pipeline import compute_tax_columns
+
+    rows = [
+        {"salary_income": 900000, "interest_income": 70000, "deduction_80D": 120000, "deduction_80TTA": 70000,
+         "deduction_80CCD": 80000},
+        {"salary_income": 900000, "interest_income": 4000, "deduction_80D": 120000, "deduction_80TTA": 9000},
+    ]
+    for age_group in AGE_GROUPS:
+        columns = {name: np.array([row.get(name, 0) for row in rows]) for name in rows[0]}
+        result = compute_tax_columns(columns, age_group)
+        for index, row in enumerate(rows):
+            expected = compute_tax(row, age_group)
+            assert result["total_deductions"][index] == expected["total_deductions"]
+            assert result["tax_old"][index] == expected["tax_old"]